@@ -1,8 +1,9 @@
-from fastapi import Depends, HTTPException, Request
+from fastapi import Depends, HTTPException, Request, Response
 from fastapi.security import APIKeyHeader
 from starlette import status
 
 from app.core.config import settings
+from app.quotas import get_quota_account
 from app.services.sds_service import SDSService
 
 
@@ -23,8 +24,21 @@ def get_api_key(
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
 
-def get_sds_service(api_key: str = Depends(get_api_key)):
-    return SDSService(sds_api_key=api_key)
+def get_admin_api_key(
+    api_key_from_header: str = Depends(
+        APIKeyHeader(name="X-SDS-SEARCH-ACCESS-API-KEY", auto_error=False)
+    ),
+) -> str:
+    if api_key_from_header and api_key_from_header in settings.ADMIN_API_KEYS:
+        return api_key_from_header
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+
+def get_sds_service(response: Response, api_key: str = Depends(get_api_key)):
+    return SDSService(
+        sds_api_key=api_key, quota=get_quota_account(api_key, response)
+    )
 
 
 sds_service_dependency = Depends(get_sds_service)
+admin_api_key_dependency = Depends(get_admin_api_key)
@@ -0,0 +1,87 @@
+from fastapi import APIRouter
+
+from app.cache import details_cache, search_cache
+from app.clients.sds_api_client import SDSAPIClient
+from app.flight_recorder import flight_recorder
+from app.limiter_storage import BatchedRedisStorage
+from app.loop_monitor import loop_monitor
+from app.pdf_cache import safety_summary_cache
+from app.quotas import quota_storage
+from app.services.extraction_progress import extraction_status_broadcaster
+from app.throttling import limiter
+
+from .dependencies import admin_api_key_dependency
+
+# Diagnostics for operators; hidden from the public API docs and only
+# readable with one of the configured ADMIN_API_KEYS.
+router = APIRouter(
+    prefix="/internal",
+    include_in_schema=False,
+    dependencies=[admin_api_key_dependency],
+)
+
+
+@router.get("/cache/")
+async def cache_stats():
+    """
+    Hit, miss and eviction counters of this worker's response caches.
+    """
+    return {
+        "details": details_cache.stats(),
+        "search": search_cache.stats(),
+        "safety_summary_pdf": safety_summary_cache.stats(),
+    }
+
+
+@router.get("/upstream/")
+async def upstream_stats():
+    """
+    Counters of this worker's upstream SDS API client.
+    """
+    return {
+        "pool": SDSAPIClient.pool_stats(),
+        "single_flight": SDSAPIClient.single_flight.stats(),
+        "circuit_breakers": SDSAPIClient.circuit_breakers.stats(),
+        "retries": SDSAPIClient.retry_policy.stats(),
+        "hedging": SDSAPIClient.hedge_policy.stats(),
+        "upload_budget": SDSAPIClient.upload_budget.stats(),
+        "extraction_status": extraction_status_broadcaster.stats(),
+    }
+
+
+@router.get("/limiter/")
+async def rate_limit_stats():
+    """
+    Counters of this worker's per-IP rate limit and API key quota
+    storages.
+    """
+    storage = limiter._storage
+    if isinstance(storage, BatchedRedisStorage):
+        ip_limits = {"storage": "batched", **storage.stats()}
+    else:
+        ip_limits = {"storage": type(storage).__name__}
+    return {"ip_limits": ip_limits, "quotas": quota_storage.stats()}
+
+
+@router.get("/loop/")
+async def loop_stats(top: int = 10):
+    """
+    Event loop lag percentiles of this worker and the call sites that
+    blocked its loop the longest, with their stacks.
+    """
+    return loop_monitor.stats(top=top)
+
+
+@router.get("/slow-requests/")
+async def slow_requests():
+    """
+    The slowest recent requests of this worker, slowest first, with
+    their time split into validation, upstream calls, post-processing
+    and serialization. API keys are reported as their access tier.
+    """
+    return {
+        "size": flight_recorder.size,
+        "window_seconds": flight_recorder.window,
+        "recorded": flight_recorder.recorded,
+        "requests": flight_recorder.entries(),
+    }
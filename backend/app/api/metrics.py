@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import render_metrics
+
+from .dependencies import admin_api_key_dependency
+
+# Scraped with one of the configured ADMIN_API_KEYS in the
+# X-SDS-SEARCH-ACCESS-API-KEY header, like the /internal diagnostics.
+router = APIRouter(
+    include_in_schema=False, dependencies=[admin_api_key_dependency]
+)
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics, aggregated over all workers in multiprocess mode.
+    """
+    # Multiprocess mode reads and merges every worker's files.
+    content, content_type = await run_in_threadpool(render_metrics)
+    return Response(content=content, headers={"Content-Type": content_type})
@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import time
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+from app.flight_recorder import current_record
+from app.tracing import current_trace, span
+
+# Start and end of the endpoint call of an instrumented route, set by its
+# wrapper (see `TracedRoute`).
+_endpoint_marks: ContextVar[list | None] = ContextVar(
+    "endpoint_marks", default=None
+)
+
+
+def _traced_endpoint(endpoint):
+    """
+    Wraps a route's endpoint in an "endpoint" span, marking where it
+    starts and ends for `TracedRoute`.
+    """
+    if getattr(endpoint, "_traced", False):
+        return endpoint  # a route copied by include_router
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            marks = _endpoint_marks.get()
+            if marks is None:
+                return await endpoint(*args, **kwargs)
+            marks.append(time.perf_counter())
+            try:
+                with span("endpoint"):
+                    return await endpoint(*args, **kwargs)
+            finally:
+                marks.append(time.perf_counter())
+
+    else:
+
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            marks = _endpoint_marks.get()
+            if marks is None:
+                return endpoint(*args, **kwargs)
+            marks.append(time.perf_counter())
+            try:
+                with span("endpoint"):
+                    return endpoint(*args, **kwargs)
+            finally:
+                marks.append(time.perf_counter())
+
+    wrapper._traced = True
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """
+    APIRoute that splits requests into the time before the endpoint runs
+    ("validate": reading the body, validating it, including the id
+    decryption of the schema validators, and the dependencies), the
+    endpoint itself and the time after it ("serialize": response_model
+    validation and JSON encoding of the result), for the request's trace
+    and flight recorder record.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            trace = current_trace()
+            record = current_record()
+            if trace is None and record is None:
+                return await handler(request)
+            if trace is not None:
+                trace.name = f"{request.method} {self.path}"
+                trace.attributes["http.route"] = self.path
+            marks = []
+            token = _endpoint_marks.set(marks)
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                end = time.perf_counter()
+                _endpoint_marks.reset(token)
+                if record is not None:
+                    record.route_timings(start, marks, end)
+                if trace is not None:
+                    endpoint_start = marks[0] if marks else end
+                    trace.record_span("validate", start, endpoint_start)
+                    if len(marks) == 2:
+                        trace.record_span("serialize", marks[1], end)
+
+        return traced_handler
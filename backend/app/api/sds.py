@@ -1,9 +1,13 @@
+import io
+
+import orjson
 from fastapi import APIRouter, Body, HTTPException, Query, Request, UploadFile, \
     Form
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from starlette import status
 
 from app import schemas
+from app.core.config import settings
 from app.exceptions import (
     SDSAPIInternalError,
     SDSAPIParamsRequired,
@@ -13,16 +17,37 @@ from app.exceptions import (
     SDSNotFoundException,
     SDSNotFoundError,
 )
+from app.responses import ModelResponse, RangeFileResponse
+from app.services.extraction_progress import ExtractionStreamInterrupted
 from app.services.sds_service import SDSService
 from app.throttling import limiter
 
 from .dependencies import sds_service_dependency
+from .routing import TracedRoute
 
-router = APIRouter(prefix="/sds")
+router = APIRouter(prefix="/sds", route_class=TracedRoute)
 
 MAX_UPLOAD_FILES = 20
 
 
+def trusted_response(
+    content, sds_service: SDSService, passthrough: bool = False
+):
+    """
+    With TRUSTED_UPSTREAM_FAST_MODE, the models SDSService validated the
+    upstream payload into are rendered as they are; so are the documents
+    of the details endpoints (`passthrough`) with DETAILS_PASSTHROUGH.
+    Otherwise they go through the route's response_model as usual.
+    """
+    if not (
+        settings.TRUSTED_UPSTREAM_FAST_MODE
+        or passthrough
+        and settings.DETAILS_PASSTHROUGH
+    ):
+        return content
+    return ModelResponse(content, headers=sds_service.quota_headers())
+
+
 @router.post(
     "/details/",
     description="Returns JSON with extracted data of SDS",
@@ -36,7 +61,11 @@ async def sds_details(
     fe: bool = Query(False, description="Optional 'fe' parameter"),
 ):
     try:
-        return await sds_service.get_sds_details(search=search_body, fe=fe)
+        return trusted_response(
+            await sds_service.get_sds_details(search=search_body, fe=fe),
+            sds_service,
+            passthrough=True,
+        )
     except (SDSAPIParamsRequired, SDSBadRequestException):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -81,7 +110,12 @@ async def get_dif_language_versions(
     fe: bool = Query(False, description="Optional 'fe' parameter"),
 ):
     try:
-        return await sds_service.get_dif_language_versions(search=search_body, fe=fe)
+        return trusted_response(
+            await sds_service.get_dif_language_versions(
+                search=search_body, fe=fe
+            ),
+            sds_service,
+        )
     except (SDSAPIParamsRequired, SDSBadRequestException) as ex:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -118,8 +152,14 @@ async def get_dif_language_versions(
 
 @router.post(
     "/multipleDetails/",
-    description="return list of SDS extracted data",
-    response_model=list[schemas.SDSDetailsSchema],
+    description=(
+        "return list of SDS extracted data. Requests above "
+        f"{settings.VALUE_LIMIT} ids are split into chunks; items of a "
+        "chunk that failed upstream are returned as errors"
+    ),
+    response_model=list[
+        schemas.BulkItemErrorSchema | schemas.SDSDetailsSchema
+    ],
 )
 @limiter.limit("5/minute")
 async def multiple_sds_details(
@@ -129,8 +169,12 @@ async def multiple_sds_details(
     fe: bool = Query(False, description="Optional 'fe' parameter"),
 ):
     try:
-        return await sds_service.get_multiple_sds_details(
-            search=search_body, fe=fe
+        return trusted_response(
+            await sds_service.get_multiple_sds_details(
+                search=search_body, fe=fe
+            ),
+            sds_service,
+            passthrough=True,
         )
     except (SDSAPIParamsRequired, SDSBadRequestException) as ex:
         raise HTTPException(
@@ -176,11 +220,14 @@ async def search_for_sds(
     fe: bool = Query(False, description="Optional 'fe' parameter"),
 ):
     try:
-        return await sds_service.search_sds(
-            search=search_body,
-            page_size=request.query_params._dict.get("page_size", 10),
-            page=request.query_params._dict.get("page", 1),
-            fe=fe
+        return trusted_response(
+            await sds_service.search_sds(
+                search=search_body,
+                page_size=request.query_params._dict.get("page_size", 10),
+                page=request.query_params._dict.get("page", 1),
+                fe=fe
+            ),
+            sds_service,
         )
     except SDSBadRequestException as ex:
         raise HTTPException(
@@ -261,8 +308,14 @@ async def search_for_new_sds_revision_info(
 
 @router.post(
     "/multipleNewRevisionInfo/",
-    description="return list of newer SDS ID and newer revision date if it exists",
-    response_model=list[schemas.MultipleNewRevisionInfoSchema],
+    description=(
+        "return list of newer SDS ID and newer revision date if it exists. "
+        f"Requests above {settings.VALUE_LIMIT} ids are split into chunks; "
+        "items of a chunk that failed upstream are returned as errors"
+    ),
+    response_model=list[
+        schemas.BulkItemErrorSchema | schemas.MultipleNewRevisionInfoSchema
+    ],
 )
 @limiter.limit("5/minute")
 async def search_for_multiple_new_sds_revision_info(
@@ -308,7 +361,7 @@ async def search_for_multiple_new_sds_revision_info(
 
 @router.post(
     "/upload/",
-    description="If SDS will be successfully extracted, all information will be returned in response. Accepts up to 20 PDF files in a single request via repeated 'file' multipart fields.",
+    description="If SDS will be successfully extracted, all information will be returned in response. Accepts up to 20 PDF files in a single request via repeated 'file' multipart fields. Files already in the SDS database (same PDF MD5) are answered with their existing data instead of being extracted again; their MD5s are listed in the X-SDS-Dedup-Hits response header. Uploads of several files always answer with a request id, and report the known files in its dedup_hits; they are only deduplicated while at least two files are new, unless 'dedup_details' is set, in which case fewer than two new files are answered with the list of every file's details in upload order.",
     response_model=(
         schemas.SDSUploadRequestIdSchema
         | schemas.SDSDetailsSchema
@@ -318,6 +371,7 @@ async def search_for_multiple_new_sds_revision_info(
 @limiter.limit("5/minute")
 async def upload_new_sds(
     request: Request,
+    response: Response,
     file: list[UploadFile],
     sds_service: SDSService = sds_service_dependency,
     fe: bool = Query(False, description="Optional 'fe' parameter"),
@@ -326,6 +380,7 @@ async def upload_new_sds(
     product_code: str = Form(default=''),
     private_import: bool = Form(default=False),
     email: str | None = Form(default=None),
+    dedup_details: bool = Form(default=False),
 ):
     if len(file) == 0 or len(file) > MAX_UPLOAD_FILES:
         raise HTTPException(
@@ -333,7 +388,7 @@ async def upload_new_sds(
             detail=f"Upload between 1 and {MAX_UPLOAD_FILES} PDF files",
         )
     try:
-        return await sds_service.upload_sds(
+        result, dedup_hits = await sds_service.upload_sds(
             files=file,
             fe=fe,
             sku=sku,
@@ -341,7 +396,11 @@ async def upload_new_sds(
             product_code=product_code,
             private_import=private_import,
             email=email,
+            dedup_details=dedup_details,
         )
+        if dedup_hits:
+            response.headers["X-SDS-Dedup-Hits"] = ",".join(dedup_hits)
+        return result
     except SDSBadRequestException as ex:
         detail = (
             ex.args[0]
@@ -412,6 +471,73 @@ async def get_sds_extraction_status(
         )
 
 
+@router.get(
+    "/extractionStatusStream/",
+    description="Stream the SDS extraction status of a request as "
+    "Server-Sent Events until the extraction finishes. The stream closes "
+    "with an `end` event once the extraction reached a terminal step, or "
+    "with an `error` event whose `reason` is `timeout` or "
+    "`status_unavailable` when it stopped following the extraction earlier",
+    response_class=StreamingResponse,
+)
+@limiter.limit("5/minute")
+async def stream_sds_extraction_status(
+    request: Request,
+    request_id: str = Query(..., description="Request ID"),
+    email: str | None = Query(None, description="Email associated with the request"),
+    sds_service: SDSService = sds_service_dependency,
+    fe: bool = Query(False, description="Optional 'fe' parameter"),
+):
+    try:
+        statuses = await sds_service.stream_extraction_status(
+            request_id=request_id, email=email, fe=fe
+        )
+    except SDSAPIRequestNotAuthorized as ex:
+        detail = (
+            ex.args[0]
+            if len(ex.args) > 0 and ex.args[0]
+            else "Invalid API key"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail=detail
+        )
+    except SDSAPIRateLimitError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=ex.args[0] if len(ex.args) > 0 and ex.args[0] else "Rate limit exceeded",
+            headers={"Retry-After": ex.retry_after} if ex.retry_after else None,
+        )
+    except SDSAPIInternalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="SDS API request failed",
+        )
+
+    async def events():
+        try:
+            async for data in statuses:
+                if data is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: status\ndata: {data}\n\n"
+        except ExtractionStreamInterrupted as ex:
+            error = orjson.dumps({"reason": ex.reason}).decode()
+            yield f"event: error\ndata: {error}\n\n"
+            return
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Do not let nginx buffer the stream.
+            "X-Accel-Buffering": "no",
+            **sds_service.quota_headers(),
+        },
+    )
+
+
 @router.post(
     "/safetyInformationSummary/",
     description="SDS safety information summary PDF",
@@ -424,8 +550,19 @@ async def get_sds_safety_information_summary(
     fe: bool = Query(False, description="Optional 'fe' parameter"),
 ):
     try:
-        pdf_content = await sds_service.get_sds_safety_information_summary(search=search_body, fe=fe)
-        return Response(pdf_content, media_type="application/pdf")
+        pdf = await sds_service.get_sds_safety_information_summary(search=search_body, fe=fe)
+        if isinstance(pdf, io.IOBase):
+            return RangeFileResponse(
+                pdf,
+                range_header=request.headers.get("range"),
+                media_type="application/pdf",
+                headers=sds_service.quota_headers(),
+            )
+        return StreamingResponse(
+            pdf,
+            media_type="application/pdf",
+            headers=sds_service.quota_headers(),
+        )
     except (SDSAPIParamsRequired, SDSBadRequestException):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
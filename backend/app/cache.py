@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "sds-gateway:cache"
+
+
+class LRUTTLCache:
+    """
+    In-process LRU cache whose entries also expire after `ttl` seconds.
+    Not thread-safe: it is only touched from the worker's event loop.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._data: OrderedDict[Hashable, tuple[float, bytes]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: bytes, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for decoded upstream JSON responses.
+
+    The first tier is a per-worker `LRUTTLCache`, the second one is Redis
+    (when configured) so that the uvicorn workers share their hits.
+    Values are stored JSON-encoded in both tiers, so every `get` returns a
+    fresh object the caller is free to mutate. A value read from Redis is
+    kept locally only for what remains of its Redis TTL, so no tier serves
+    it for longer than `ttl` after it was fetched from the upstream. Redis errors are logged and
+    treated as misses: the cache must never fail a request.
+    """
+
+    def __init__(self, namespace: str, ttl: int, max_entries: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _redis_key(self, key: tuple) -> str:
+        parts = ":".join("" if part is None else str(part) for part in key)
+        return f"{REDIS_KEY_PREFIX}:{self.namespace}:{parts}"
+
+    async def get(self, key: tuple) -> Any | None:
+        if not self.enabled:
+            return None
+        raw = self._local.get(key)
+        if raw is not None:
+            self.local_hits += 1
+            return json.loads(raw)
+
+        redis = get_redis()
+        if redis is not None:
+            ttl_ms = -2
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.get(self._redis_key(key))
+                    pipe.pttl(self._redis_key(key))
+                    raw, ttl_ms = await pipe.execute()
+            except RedisError as e:
+                self.redis_errors += 1
+                logger.warning("Redis cache read failed: %s", e)
+            if raw is not None:
+                self.redis_hits += 1
+                # -1: no expiry (not set by us); -2: expired since the GET.
+                if ttl_ms == -1:
+                    self._local.set(key, raw)
+                elif ttl_ms > 0:
+                    self._local.set(key, raw, ttl=min(self.ttl, ttl_ms / 1000))
+                return json.loads(raw)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: tuple, value: Any) -> None:
+        if not self.enabled:
+            return
+        raw = json.dumps(value, separators=(",", ":")).encode()
+        self._local.set(key, raw)
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.set(self._redis_key(key), raw, ex=self.ttl)
+            except RedisError as e:
+                self.redis_errors += 1
+                logger.warning("Redis cache write failed: %s", e)
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._local),
+            "max_entries": self._local.max_entries,
+            "ttl": self.ttl,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self._local.evictions,
+            "expirations": self._local.expirations,
+            "redis_errors": self.redis_errors,
+        }
+
+
+def search_fingerprint(search_data: dict, page, page_size) -> str:
+    """
+    Canonical fingerprint of an upstream /sds/search/ query: the free-text
+    search is trimmed and case-folded, advanced_search fields are sorted
+    and empty ones dropped, so equivalent queries share a cache entry.
+    """
+    canonical = dict(search_data)
+    if canonical.get("search"):
+        canonical["search"] = " ".join(canonical["search"].split()).casefold()
+    if canonical.get("advanced_search"):
+        canonical["advanced_search"] = {
+            field: value
+            for field, value in canonical["advanced_search"].items()
+            if value not in (None, "")
+        }
+    canonical["page"] = str(page)
+    canonical["page_size"] = str(page_size)
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+details_cache = ResponseCache(
+    namespace="details",
+    ttl=settings.DETAILS_CACHE_TTL,
+    max_entries=settings.DETAILS_CACHE_MAX_ENTRIES,
+)
+search_cache = ResponseCache(
+    namespace="search",
+    ttl=settings.SEARCH_CACHE_TTL,
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+)
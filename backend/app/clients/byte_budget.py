@@ -0,0 +1,54 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class ByteBudget:
+    """
+    Caps the bytes held by concurrent operations of this worker.
+
+    `reserve(n)` waits until `n` bytes fit under the capacity, which pushes
+    back on new uploads while large ones are in flight. A reservation
+    larger than the whole capacity is clamped to it so it can still run
+    (alone).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.waiting = 0
+        self._condition: asyncio.Condition | None = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int, timeout: float | None = None):
+        nbytes = min(nbytes, self.capacity)
+        async with self.condition:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(
+                        lambda: self.in_use + nbytes <= self.capacity
+                    ),
+                    timeout,
+                )
+            finally:
+                self.waiting -= 1
+            self.in_use += nbytes
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.in_use -= nbytes
+                self.condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+        }
@@ -0,0 +1,219 @@
+import math
+import time
+from typing import Awaitable, Callable
+
+from httpx import Response, TransportError
+from starlette import status
+
+from app.exceptions import SDSAPIUnavailableError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Upstream answers that count as failures: the upstream (or the proxy in
+# front of it) is not able to serve, whatever the request.
+FAILURE_STATUS_CODES = {
+    status.HTTP_500_INTERNAL_SERVER_ERROR,
+    status.HTTP_502_BAD_GATEWAY,
+    status.HTTP_503_SERVICE_UNAVAILABLE,
+    status.HTTP_504_GATEWAY_TIMEOUT,
+}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one upstream endpoint.
+
+    While closed, the outcomes of the calls over the last `window` seconds
+    are counted; once there were at least `min_calls`, a `failure_rate` of
+    failures (transport errors and `FAILURE_STATUS_CODES`) or a
+    `slow_rate` of calls slower than `slow_call_seconds` opens the
+    circuit. While open, calls fail at once with `SDSAPIUnavailableError`.
+    After `open_seconds` the circuit is half-open: up to `probes` calls go
+    through, and it closes once that many succeed, or opens again on the
+    first failure.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float,
+        slow_rate: float,
+        slow_call_seconds: float,
+        min_calls: int,
+        open_seconds: float,
+        probes: int,
+        window: int = 10,
+    ):
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.window = window
+        self.state = CLOSED
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # Ring of [second, calls, failures, slow calls] buckets.
+        self._buckets = [[0, 0, 0, 0] for _ in range(window)]
+
+    def _bucket(self, now: float) -> list:
+        second = int(now)
+        bucket = self._buckets[second % self.window]
+        if bucket[0] != second:
+            bucket[:] = [second, 0, 0, 0]
+        return bucket
+
+    def _totals(self, now: float) -> tuple[int, int, int]:
+        oldest = int(now) - self.window
+        calls = failures = slow = 0
+        for bucket in self._buckets:
+            if bucket[0] > oldest:
+                calls += bucket[1]
+                failures += bucket[2]
+                slow += bucket[3]
+        return calls, failures, slow
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened += 1
+        self._opened_at = now
+        # Probes still in flight give their slot back when they finish.
+        self._probe_successes = 0
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self._buckets = [[0, 0, 0, 0] for _ in range(self.window)]
+
+    def retry_after(self, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        remaining = self._opened_at + self.open_seconds - now
+        return max(1, math.ceil(remaining))
+
+    def acquire(self) -> bool:
+        """
+        Whether a call may go through now; True means it is a probe.
+        Raises `SDSAPIUnavailableError` while the circuit is open.
+        """
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise SDSAPIUnavailableError(
+                    retry_after=str(self.retry_after(now))
+                )
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.probes:
+                self.rejected += 1
+                raise SDSAPIUnavailableError(retry_after="1")
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def record(self, probe: bool, failed: bool, seconds: float | None):
+        now = time.monotonic()
+        slow = seconds is not None and seconds > self.slow_call_seconds
+        if probe:
+            self._probes_in_flight -= 1
+            if self.state != HALF_OPEN:
+                return
+            if failed or slow:
+                self._open(now)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.probes:
+                self._close()
+            return
+
+        bucket = self._bucket(now)
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += slow
+        if self.state != CLOSED:
+            return
+        calls, failures, slow_calls = self._totals(now)
+        if calls >= self.min_calls and (
+            failures >= self.failure_rate * calls
+            or slow_calls >= self.slow_rate * calls
+        ):
+            self._open(now)
+
+    def release(self, probe: bool) -> None:
+        """
+        Gives back the probe slot of a call that was cancelled.
+        """
+        if probe:
+            self._probes_in_flight -= 1
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[Response]],
+        track_latency: bool = True,
+    ) -> Response:
+        probe = self.acquire()
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except TransportError:
+            self.record(probe, failed=True, seconds=None)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        self.record(
+            probe,
+            failed=response.status_code in FAILURE_STATUS_CODES,
+            seconds=time.perf_counter() - start if track_latency else None,
+        )
+        return response
+
+    def stats(self) -> dict:
+        calls, failures, slow = self._totals(time.monotonic())
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failures": failures,
+            "slow_calls": slow,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakers:
+    """
+    One `CircuitBreaker` per upstream endpoint, created on first use.
+    """
+
+    def __init__(self, enabled: bool, **breaker_options):
+        self.enabled = enabled
+        self.breaker_options = breaker_options
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(
+                **self.breaker_options
+            )
+        return breaker
+
+    async def call(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[Response]],
+        track_latency: bool = True,
+    ) -> Response:
+        if not self.enabled:
+            return await send()
+        return await self.get(endpoint).call(send, track_latency)
+
+    def stats(self) -> dict:
+        return {
+            endpoint: breaker.stats()
+            for endpoint, breaker in self._breakers.items()
+        }
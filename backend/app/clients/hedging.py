@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable
+
+from httpx import Response
+
+from app.clients.retry import RetryBudget
+
+
+class LatencyTracker:
+    """
+    Latencies of the last `size` calls of an endpoint. The quantile is
+    recomputed every `refresh` samples rather than on each read.
+    """
+
+    def __init__(self, quantile: float, size: int = 1024, refresh: int = 32):
+        self.quantile = quantile
+        self.refresh = refresh
+        self._samples: deque[float] = deque(maxlen=size)
+        self._since_refresh = 0
+        self._value: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._since_refresh += 1
+
+    def value(self) -> float | None:
+        if self._value is None or self._since_refresh >= self.refresh:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, int(self.quantile * len(ordered)))
+            self._value = ordered[index]
+            self._since_refresh = 0
+        return self._value
+
+
+class HedgePolicy:
+    """
+    Sends a second, identical request when the first one has not answered
+    within the endpoint's observed latency quantile (but not sooner than
+    `min_delay`), and returns whichever answers first; the other one is
+    cancelled. Only meant for idempotent calls.
+
+    Hedging starts once an endpoint has `min_samples` latencies, and hedges
+    are capped to `max_rate` of the endpoint's calls over 10 seconds so a
+    slow upstream does not see its load doubled.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        endpoints: Iterable[str],
+        quantile: float,
+        min_delay: float,
+        max_rate: float,
+        min_samples: int,
+    ):
+        self.enabled = enabled
+        self.endpoints = set(endpoints)
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._latencies: dict[str, LatencyTracker] = {}
+        self._budgets: dict[str, RetryBudget] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def _tracker(self, endpoint: str) -> LatencyTracker:
+        tracker = self._latencies.get(endpoint)
+        if tracker is None:
+            tracker = self._latencies[endpoint] = LatencyTracker(self.quantile)
+        return tracker
+
+    def _budget(self, endpoint: str) -> RetryBudget:
+        budget = self._budgets.get(endpoint)
+        if budget is None:
+            budget = self._budgets[endpoint] = RetryBudget(
+                self.max_rate, min_per_second=0
+            )
+        return budget
+
+    def _count(self, endpoint: str, counter: str) -> None:
+        counters = self._counters.setdefault(
+            endpoint,
+            {
+                "calls": 0,
+                "hedged": 0,
+                "hedge_wins": 0,
+                "primary_wins": 0,
+                "rate_limited": 0,
+            },
+        )
+        counters[counter] += 1
+
+    def threshold(self, endpoint: str) -> float | None:
+        """
+        Seconds after which a call to `endpoint` is hedged, or None while
+        there are too few samples.
+        """
+        tracker = self._tracker(endpoint)
+        if len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.value())
+
+    async def _timed(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[Response]],
+        record_cancelled: bool = False,
+    ) -> Response:
+        """
+        Records the latency of `send`. With `record_cancelled`, a call
+        cancelled before answering records the time it had run so far, as
+        a lower bound: otherwise the slow primaries that lose to their
+        hedge would never be sampled, and the quantile would drift down.
+        """
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except asyncio.CancelledError:
+            if record_cancelled:
+                self._tracker(endpoint).record(time.perf_counter() - start)
+            raise
+        self._tracker(endpoint).record(time.perf_counter() - start)
+        return response
+
+    async def call(
+        self, endpoint: str, send: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        if not self.enabled or endpoint not in self.endpoints:
+            return await send()
+
+        self._count(endpoint, "calls")
+        self._budget(endpoint).record_call()
+        threshold = self.threshold(endpoint)
+        primary = asyncio.ensure_future(
+            self._timed(endpoint, send, record_cancelled=True)
+        )
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if done:
+                return primary.result()
+            if not self._budget(endpoint).try_acquire():
+                self._count(endpoint, "rate_limited")
+                return await primary
+
+            self._count(endpoint, "hedged")
+            hedge = asyncio.ensure_future(self._timed(endpoint, send))
+            tasks.add(hedge)
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Prefer a response; an error only counts once both
+                # requests have failed.
+                winner = next(
+                    (task for task in done if task.exception() is None),
+                    None,
+                )
+                if winner is not None:
+                    self._count(
+                        endpoint,
+                        "hedge_wins" if winner is hedge else "primary_wins",
+                    )
+                    return winner.result()
+                if not pending:
+                    return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        stats = {}
+        for endpoint, counters in self._counters.items():
+            threshold = self.threshold(endpoint)
+            stats[endpoint] = {
+                **counters,
+                "threshold_ms": (
+                    None if threshold is None else round(threshold * 1000, 1)
+                ),
+            }
+        return stats
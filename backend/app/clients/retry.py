@@ -0,0 +1,205 @@
+import asyncio
+import email.utils
+import random
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from httpx import ReadTimeout, Response, TransportError
+from starlette import status
+
+from app.tracing import span
+
+# Upstream answers worth another attempt of an idempotent call.
+RETRYABLE_STATUS_CODES = {
+    status.HTTP_429_TOO_MANY_REQUESTS,
+    status.HTTP_502_BAD_GATEWAY,
+    status.HTTP_503_SERVICE_UNAVAILABLE,
+    status.HTTP_504_GATEWAY_TIMEOUT,
+}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Seconds to wait according to a Retry-After header, which holds either
+    a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryBudget:
+    """
+    Caps the retries of one endpoint to `ratio` of its calls over the last
+    `window` seconds, plus `min_per_second` so that quiet endpoints can
+    still retry. When the upstream is down every call fails, and the
+    budget keeps retries from multiplying the load on it.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: int = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        # Ring of [second, calls, retries] buckets.
+        self._buckets = [[0, 0, 0] for _ in range(window)]
+
+    def _bucket(self, now: float) -> list:
+        second = int(now)
+        bucket = self._buckets[second % self.window]
+        if bucket[0] != second:
+            bucket[:] = [second, 0, 0]
+        return bucket
+
+    def _totals(self, now: float) -> tuple[int, int]:
+        oldest = int(now) - self.window
+        calls = retries = 0
+        for second, bucket_calls, bucket_retries in self._buckets:
+            if second > oldest:
+                calls += bucket_calls
+                retries += bucket_retries
+        return calls, retries
+
+    def record_call(self) -> None:
+        self._bucket(time.monotonic())[1] += 1
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        calls, retries = self._totals(now)
+        allowed = self.min_per_second * self.window + self.ratio * calls
+        if retries >= allowed:
+            return False
+        self._bucket(now)[2] += 1
+        return True
+
+
+class RetryPolicy:
+    """
+    Retries idempotent upstream calls on transport errors and on
+    `RETRYABLE_STATUS_CODES`. Read timeouts are the exception: the
+    upstream already had the full timeout to answer, and retrying would
+    multiply how long the client waits.
+
+    The delay before a retry is the upstream Retry-After when it sent one,
+    else a "full jitter" exponential backoff: a random time up to
+    `base_delay * 2**retry`, capped at `max_delay`. A Retry-After longer
+    than `max_retry_after` is not waited for: the response goes back to
+    the caller, which reports it to the client. Each endpoint has its own
+    `RetryBudget`.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        max_retry_after: float,
+        budget_ratio: float,
+        budget_min_per_second: float,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget_ratio = budget_ratio
+        self.budget_min_per_second = budget_min_per_second
+        self._budgets: dict[str, RetryBudget] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def _budget(self, endpoint: str) -> RetryBudget:
+        budget = self._budgets.get(endpoint)
+        if budget is None:
+            budget = self._budgets[endpoint] = RetryBudget(
+                self.budget_ratio, self.budget_min_per_second
+            )
+        return budget
+
+    def _count(self, endpoint: str, counter: str) -> None:
+        counters = self._counters.setdefault(
+            endpoint,
+            {
+                "calls": 0,
+                "retries": 0,
+                "recovered": 0,
+                "exhausted": 0,
+                "budget_denied": 0,
+                "retry_after_too_long": 0,
+            },
+        )
+        counters[counter] += 1
+
+    def backoff(self, retry: int) -> float:
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2**retry)
+        )
+
+    def _delay(self, endpoint: str, retry: int, response: Response | None):
+        """
+        Seconds to wait before retry number `retry`, or None to give up.
+        """
+        if retry >= self.max_attempts:
+            self._count(endpoint, "exhausted")
+            return None
+        delay = self.backoff(retry - 1)
+        if response is not None:
+            retry_after = parse_retry_after(
+                response.headers.get("Retry-After")
+            )
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    self._count(endpoint, "retry_after_too_long")
+                    return None
+                delay = retry_after
+        if not self._budget(endpoint).try_acquire():
+            self._count(endpoint, "budget_denied")
+            return None
+        return delay
+
+    async def call(
+        self, endpoint: str, send: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """
+        Runs `send` until it returns a response that is not retryable, or
+        retrying is no longer allowed; then returns the last response or
+        raises the last transport error.
+        """
+        self._budget(endpoint).record_call()
+        self._count(endpoint, "calls")
+        retry = 0
+        while True:
+            try:
+                response = await send()
+            except ReadTimeout:
+                raise
+            except TransportError:
+                delay = self._delay(endpoint, retry + 1, None)
+                if delay is None:
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    if retry:
+                        self._count(endpoint, "recovered")
+                    return response
+                delay = self._delay(endpoint, retry + 1, response)
+                if delay is None:
+                    return response
+            retry += 1
+            self._count(endpoint, "retries")
+            with span("retry_wait", endpoint=endpoint, retry=retry):
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            endpoint: dict(counters)
+            for endpoint, counters in self._counters.items()
+        }
@@ -1,74 +1,291 @@
 import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable
 
+import orjson
 from fastapi import UploadFile
 from fastapi.encoders import jsonable_encoder
-from httpx import AsyncClient, HTTPError
+from httpx import AsyncClient, HTTPError, Limits, Response
 from starlette import status
 
 from app import schemas
+from app.cache import details_cache, search_cache, search_fingerprint
+from app.clients.byte_budget import ByteBudget
+from app.clients.circuit_breaker import CircuitBreakers
+from app.clients.hedging import HedgePolicy
+from app.clients.retry import RetryPolicy
+from app.clients.single_flight import SingleFlight
 from app.core.config import settings
 from app.exceptions import (
     SDSAPIInternalError,
     SDSAPIParamsRequired,
     SDSAPIRateLimitError,
     SDSAPIRequestNotAuthorized,
+    SDSAPIUnavailableError,
     SDSBadRequestException,
     SDSNotFoundException,
     SDSNotFoundError,
 )
-from app.utils import encrypt_number, update_search_id
+from app.flight_recorder import current_record
+from app.metrics import UPSTREAM_LATENCY, observe_upstream
+from app.tracing import span
+from app.utils import (
+    SizeLimitedReader,
+    encrypt_number,
+    encrypted_id_map,
+    get_access_tier,
+    update_search_id,
+    upload_file_size,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a startup warm-up request may take before it is given up.
+UPSTREAM_WARM_UP_TIMEOUT = 5
 
 
 class SDSAPIClient:
-    _client_registry: dict[str, AsyncClient] = {}
-    MAX_CACHED_CLIENTS: int = 256
+    # One connection pool to the upstream per worker, shared by every API
+    # key: the auth headers are sent per request.
+    _shared_client: AsyncClient | None = None
+    # Identical read requests in flight at the same time share one
+    # upstream call (per worker).
+    single_flight = SingleFlight()
+    # Bytes of uploads being streamed upstream by this worker.
+    upload_budget = ByteBudget(settings.UPLOAD_INFLIGHT_BYTES_LIMIT)
+    # Retries of idempotent reads, with a retry budget per endpoint.
+    retry_policy = RetryPolicy(
+        max_attempts=settings.UPSTREAM_RETRY_MAX_ATTEMPTS,
+        base_delay=settings.UPSTREAM_RETRY_BASE_DELAY,
+        max_delay=settings.UPSTREAM_RETRY_MAX_DELAY,
+        max_retry_after=settings.UPSTREAM_RETRY_MAX_RETRY_AFTER,
+        budget_ratio=settings.UPSTREAM_RETRY_BUDGET_RATIO,
+        budget_min_per_second=settings.UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND,
+    )
+    # Fail fast while an upstream endpoint keeps failing or timing out.
+    circuit_breakers = CircuitBreakers(
+        enabled=settings.UPSTREAM_CIRCUIT_BREAKER_ENABLED,
+        failure_rate=settings.UPSTREAM_CIRCUIT_FAILURE_RATE,
+        slow_rate=settings.UPSTREAM_CIRCUIT_SLOW_RATE,
+        slow_call_seconds=settings.UPSTREAM_CIRCUIT_SLOW_CALL_SECONDS,
+        min_calls=settings.UPSTREAM_CIRCUIT_MIN_CALLS,
+        open_seconds=settings.UPSTREAM_CIRCUIT_OPEN_SECONDS,
+        probes=settings.UPSTREAM_CIRCUIT_PROBES,
+    )
+    # Second requests for reads slower than the endpoint's usual latency.
+    hedge_policy = HedgePolicy(
+        enabled=settings.UPSTREAM_HEDGE_ENABLED,
+        endpoints=settings.UPSTREAM_HEDGE_ENDPOINTS,
+        quantile=settings.UPSTREAM_HEDGE_QUANTILE,
+        min_delay=settings.UPSTREAM_HEDGE_MIN_DELAY,
+        max_rate=settings.UPSTREAM_HEDGE_MAX_RATE,
+        min_samples=settings.UPSTREAM_HEDGE_MIN_SAMPLES,
+    )
 
     def __init__(self, api_key: str):
         self._api_key = api_key
+        self.auth_headers = {"SDS-SEARCH-ACCESS-API-KEY": api_key}
+        # Authenticate this gateway to the upstream SDS API so it
+        # includes the wish-list-gated `hazardous` block — but only
+        # for real customer keys: the internal SDS_API_KEY serves the
+        # public sdsmanager.com demo frontend, which must not expose
+        # hazard data to anonymous visitors.
+        if settings.SDS_GATEWAY_SECRET and api_key != settings.SDS_API_KEY:
+            self.auth_headers["SDS-GATEWAY-AUTH"] = settings.SDS_GATEWAY_SECRET
 
     @classmethod
-    def get_or_create_client(cls, api_key: str) -> AsyncClient:
-        client = cls._client_registry.get(api_key)
+    def get_shared_client(cls) -> AsyncClient:
+        client = cls._shared_client
         if client is None or client.is_closed:
-            if len(cls._client_registry) >= cls.MAX_CACHED_CLIENTS and api_key not in cls._client_registry:
-                oldest_key = next(iter(cls._client_registry))
-                evicted = cls._client_registry.pop(oldest_key)
+            http2 = settings.UPSTREAM_HTTP2
+            if http2:
                 try:
-                    asyncio.create_task(evicted.aclose())
-                except RuntimeError:
-                    pass  # no running event loop, GC will handle it
-            headers = {"SDS-SEARCH-ACCESS-API-KEY": api_key}
-            # Authenticate this gateway to the upstream SDS API so it
-            # includes the wish-list-gated `hazardous` block — but only
-            # for real customer keys: the internal SDS_API_KEY serves the
-            # public sdsmanager.com demo frontend, which must not expose
-            # hazard data to anonymous visitors.
-            if (
-                settings.SDS_GATEWAY_SECRET
-                and api_key != settings.SDS_API_KEY
-            ):
-                headers["SDS-GATEWAY-AUTH"] = settings.SDS_GATEWAY_SECRET
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning(
+                        "UPSTREAM_HTTP2 is set but the h2 package is not "
+                        "installed, using HTTP/1.1"
+                    )
+                    http2 = False
             client = AsyncClient(
                 base_url=settings.SDS_API_URL,
                 timeout=settings.SDS_API_TIMEOUT,
-                headers=headers,
+                limits=Limits(
+                    max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=(
+                        settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS
+                    ),
+                    keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+                ),
+                http2=http2,
             )
-            cls._client_registry[api_key] = client
+            cls._shared_client = client
         return client
 
     @classmethod
-    async def close_all_clients(cls) -> None:
-        for client in cls._client_registry.values():
-            await client.aclose()
-        cls._client_registry.clear()
+    async def warm_up(cls) -> None:
+        """
+        Opens UPSTREAM_WARM_CONNECTIONS keep-alive connections so that the
+        first requests after startup skip the TCP and TLS handshakes.
+        """
+        client = cls.get_shared_client()
+        count = min(
+            settings.UPSTREAM_WARM_CONNECTIONS,
+            settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        if count <= 0:
+            return
+        results = await asyncio.gather(
+            *(
+                client.head("/", timeout=UPSTREAM_WARM_UP_TIMEOUT)
+                for _ in range(count)
+            ),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            logger.warning(
+                "Upstream warm-up: %d of %d connections failed: %s",
+                len(errors),
+                count,
+                errors[0],
+            )
+
+    @classmethod
+    async def close_shared_client(cls) -> None:
+        if cls._shared_client is not None:
+            await cls._shared_client.aclose()
+            cls._shared_client = None
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """
+        Connection counts of the shared pool. Reads httpcore internals, so
+        anything it cannot find is reported as None.
+        """
+        stats = {
+            "max_connections": settings.UPSTREAM_MAX_CONNECTIONS,
+            "max_keepalive_connections": (
+                settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            "connections": None,
+            "active": None,
+            "idle": None,
+            "http2": None,
+            "queued_requests": None,
+        }
+        client = cls._shared_client
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if pool is None:
+            return stats
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        stats.update(
+            connections=len(connections),
+            active=len(connections) - idle,
+            idle=idle,
+            http2=sum(
+                1
+                for connection in connections
+                if connection.info().startswith("HTTP/2")
+            ),
+        )
+        requests = getattr(pool, "_requests", None)
+        if requests is not None:
+            stats["queued_requests"] = sum(
+                1
+                for request in requests
+                if getattr(request, "connection", None) is None
+            )
+        return stats
 
     @property
     def api_key(self) -> str:
         return self._api_key
 
+    @property
+    def access_tier(self) -> str:
+        return get_access_tier(self._api_key)
+
     @property
     def session(self) -> AsyncClient:
-        return self.get_or_create_client(self._api_key)
+        return self.get_shared_client()
+
+    async def _call_upstream(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[Response]],
+        track_latency: bool = True,
+    ) -> Response:
+        """
+        Single attempt of an upstream call: through the endpoint's circuit
+        breaker, with latency and status recorded in the metrics, in an
+        "upstream" span of the request's trace and in its flight recorder
+        record.
+        """
+        record = current_record()
+        if record is not None:
+            record.upstream_started()
+        response = None
+        try:
+            with span("upstream", endpoint=endpoint) as upstream_span:
+                try:
+                    response = await self.circuit_breakers.call(
+                        endpoint,
+                        lambda: observe_upstream(endpoint, send),
+                        track_latency=track_latency,
+                    )
+                except SDSAPIUnavailableError:
+                    UPSTREAM_LATENCY.labels(endpoint, "rejected").observe(0)
+                    raise
+                upstream_span.set_attribute(
+                    "http.status_code", response.status_code
+                )
+                return response
+        finally:
+            if record is not None:
+                record.upstream_finished(
+                    endpoint,
+                    response and response.status_code,
+                    response.num_bytes_downloaded if response else 0,
+                )
+
+    async def _request_idempotent(
+        self, method: str, url: str, **kwargs
+    ) -> Response:
+        """
+        Sends a read-only request through the endpoint's circuit breaker,
+        hedged per `hedge_policy` and retried per `retry_policy`.
+        """
+        return await self.retry_policy.call(
+            url,
+            lambda: self.hedge_policy.call(
+                url,
+                lambda: self._call_upstream(
+                    url,
+                    lambda: self.session.request(
+                        method, url=url, headers=self.auth_headers, **kwargs
+                    ),
+                ),
+            ),
+        )
+
+    async def _post_coalesced(
+        self, url: str, json_data: dict, params: dict | None = None
+    ) -> Response:
+        key = (
+            url,
+            self.access_tier,
+            json.dumps(json_data, sort_keys=True, default=str),
+            tuple(sorted((params or {}).items())),
+        )
+        return await self.single_flight.do(
+            key,
+            lambda: self._request_idempotent(
+                "POST", url, params=params, json=json_data
+            ),
+        )
 
     async def search_sds(
         self,
@@ -104,19 +321,48 @@ class SDSAPIClient:
         elif is_current_version is None:
             search_data["is_current_version"] = "all"
 
+        cache_key = (
+            self.access_tier,
+            search_fingerprint(search_data, page=page, page_size=page_size),
+        )
+        response_jsons = await search_cache.get(cache_key)
+        if response_jsons is None:
+            response_jsons = await self._fetch_search_results(
+                search_data, page=page, page_size=page_size
+            )
+            await search_cache.set(cache_key, response_jsons)
+
+        with span("search_ids"):
+            for response_json in response_jsons:
+                if response_json and response_json.get("id"):
+                    if fe or self.api_key == settings.SDS_API_KEY:
+                        response_json["search_id"] = encrypt_number(
+                            response_json.get("id"),
+                            settings.SECRET_KEY,
+                        )
+                    else:
+                        response_json["search_id"] = response_json.get("id")
+
+        return response_jsons
+
+    async def _fetch_search_results(
+        self, search_data: dict, page: int, page_size: int
+    ) -> list[dict]:
         try:
-            response = await self.session.post(
+            response = await self._post_coalesced(
                 url="/sds/search/",
                 params={"page": page, "page_size": page_size},
-                json=search_data,
+                json_data=search_data,
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
@@ -125,7 +371,7 @@ class SDSAPIClient:
         if response.status_code == status.HTTP_403_FORBIDDEN:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You do not have permission to access this resource"
                     )
                 )
@@ -133,40 +379,27 @@ class SDSAPIClient:
 
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
 
         if response.status_code == status.HTTP_404_NOT_FOUND:
             if response.content:
-                response_json = response.json()
-                error_message = response_json.get("error_message", None)
+                error_message = body.get("error_message", None)
                 if not error_message:
-                    error_message = response_json.get("detail", "Not found")
+                    error_message = body.get("detail", "Not found")
 
                 raise SDSNotFoundError(error_message)
             raise SDSNotFoundError
 
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             raise SDSBadRequestException(
-                response.json().get("error_message", "Default bad request")
+                body.get("error_message", "Default bad request")
             )
 
         if response.status_code != status.HTTP_200_OK:
             raise SDSAPIInternalError
 
-        response_jsons: dict = response.json()
-        if response.status_code == status.HTTP_200_OK:
-            for response_json in response_jsons:
-                if response_json and response_json.get("id"):
-                    if fe or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY") == settings.SDS_API_KEY:
-                        response_json["search_id"] = encrypt_number(
-                            response_json.get("id"),
-                            settings.SECRET_KEY,
-                        )
-                    else:
-                        response_json["search_id"] = response_json.get("id")
-
-        return response_jsons
+        return body
 
     async def get_sds_details(
         self,
@@ -185,50 +418,72 @@ class SDSAPIClient:
         if not search_data:
             raise SDSAPIParamsRequired
 
+        cache_key = (
+            self.access_tier,
+            search_data.get("sds_id"),
+            search_data.get("pdf_md5"),
+            search_data.get("language_code"),
+        )
+        response_json = await details_cache.get(cache_key)
+        if response_json is None:
+            status_code, response_json = await self._fetch_sds_details(
+                search_data
+            )
+            if status_code != status.HTTP_200_OK:
+                return response_json
+            if response_json:
+                await details_cache.set(cache_key, response_json)
+
+        if response_json and response_json.get("id"):
+            response_json["search_id"] = encrypt_number(
+                    response_json.get("id"),
+                    settings.SECRET_KEY,
+                )
+            
+            # access_key_match = fe or self.api_key == settings.SDS_API_KEY
+
+            # update_search_id(
+            #     response_json,
+            #     [sds_id] if sds_id else None,
+            #     access_key_match,
+            #     search_key="id",
+            #     allow_none=True
+            # )
+
+        return response_json
+
+    async def _fetch_sds_details(self, search_data: dict) -> tuple[int, dict]:
         try:
-            response = await self.session.post(
+            response = await self._post_coalesced(
                 url="/sds/details/",
-                json=search_data,
+                json_data=search_data,
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
             raise SDSAPIRequestNotAuthorized
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
         if response.status_code == status.HTTP_404_NOT_FOUND:
             raise SDSNotFoundException
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             raise SDSBadRequestException
+        if response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            # Not a details document, whatever the body says.
+            raise SDSAPIInternalError
 
-        response_json: dict = response.json()
-        if response.status_code == status.HTTP_200_OK:
-            if response_json and response_json.get("id"):
-                response_json["search_id"] = encrypt_number(
-                        response_json.get("id"),
-                        settings.SECRET_KEY,
-                    )
-                
-                # access_key_match = fe or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY") == settings.SDS_API_KEY
-
-                # update_search_id(
-                #     response_json,
-                #     [sds_id] if sds_id else None,
-                #     access_key_match,
-                #     search_key="id",
-                #     allow_none=True
-                # )
-
-        return response_json
+        return response.status_code, body
 
     async def get_dif_language_versions(
         self,
@@ -251,17 +506,18 @@ class SDSAPIClient:
             raise SDSAPIParamsRequired
 
         try:
-            response = await self.session.post(
-                url="/sds/getDifLanguageVersions/",
-                json=search_data,
+            response = await self._request_idempotent(
+                "POST", "/sds/getDifLanguageVersions/", json=search_data
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
@@ -269,7 +525,7 @@ class SDSAPIClient:
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             if response.content:
                 raise SDSAPIRateLimitError(
-                    response.json().get("error_message", "Rate limit exceeded")
+                    body.get("error_message", "Rate limit exceeded")
                 )
             raise SDSAPIRateLimitError
         if response.status_code == status.HTTP_404_NOT_FOUND:
@@ -277,21 +533,22 @@ class SDSAPIClient:
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             if response.content:
                 raise SDSBadRequestException(
-                    response.json().get("error_message", "Bad request")
+                    body.get("error_message", "Bad request")
                 )
             raise SDSBadRequestException
 
-        response_jsons: list = response.json()
+        response_jsons: list = body
         if response.status_code == status.HTTP_200_OK:
-            for response_json in response_jsons:
-                if response_json and isinstance(response_json, dict) and response_json.get("id"):
-                    if fe or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY") == settings.SDS_API_KEY:
-                        response_json["search_id"] = encrypt_number(
-                            response_json.get("id"),
-                            settings.SECRET_KEY,
-                        )
-                    else:
-                        response_json["search_id"] = response_json.get("id")
+            with span("search_ids"):
+                for response_json in response_jsons:
+                    if response_json and isinstance(response_json, dict) and response_json.get("id"):
+                        if fe or self.api_key == settings.SDS_API_KEY:
+                            response_json["search_id"] = encrypt_number(
+                                response_json.get("id"),
+                                settings.SECRET_KEY,
+                            )
+                        else:
+                            response_json["search_id"] = response_json.get("id")
 
         return response_jsons
 
@@ -310,47 +567,50 @@ class SDSAPIClient:
             raise SDSAPIParamsRequired
 
         try:
-            response = await self.session.post(
-                url="/sds/multipleDetails/",
-                json=search_data,
+            response = await self._request_idempotent(
+                "POST", "/sds/multipleDetails/", json=search_data
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
             raise SDSAPIRequestNotAuthorized
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             if response.content:
                 raise SDSBadRequestException(
-                    response.json().get(
+                    body.get(
                         "error_message", "At least one param is required"
                     )
                 )
             raise SDSBadRequestException
 
-        response_jsons: dict = response.json()
+        response_jsons: dict = body
         if response.status_code == status.HTTP_200_OK:
-            for response_json in response_jsons:
-                if response_json and response_json.get("id"):
-                    access_key_match = fe or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY") == settings.SDS_API_KEY
-
-                    update_search_id(
-                        response_json,
-                        sds_id,
-                        access_key_match,
-                        search_key="id",
-                        allow_none=True
-                    )
+            encrypted_ids = encrypted_id_map(sds_id)
+            with span("search_ids"):
+                for response_json in response_jsons:
+                    if response_json and response_json.get("id"):
+                        access_key_match = fe or self.api_key == settings.SDS_API_KEY
+
+                        update_search_id(
+                            response_json,
+                            encrypted_ids,
+                            access_key_match,
+                            search_key="id",
+                            allow_none=True
+                        )
 
         return response_jsons
 
@@ -367,31 +627,33 @@ class SDSAPIClient:
             search_data["pdf_md5"] = pdf_md5
 
         try:
-            response = await self.session.post(
+            response = await self._post_coalesced(
                 url="/sds/newRevisionInfo/",
-                json=search_data,
+                json_data=search_data,
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
             raise SDSAPIRequestNotAuthorized
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
         if response.status_code == status.HTTP_404_NOT_FOUND:
             raise SDSNotFoundException
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             raise SDSBadRequestException
 
-        response_json: dict = response.json()
+        response_json: dict = body
 
         if response.status_code == status.HTTP_200_OK:
             if response_json["newer"] and response_json["newer"].get("sds_id"):
@@ -404,7 +666,7 @@ class SDSAPIClient:
                 response_json["newer"]["search_id"] = encrypt_number(
                     response_json["newer"]["search_id"], settings.SECRET_KEY
                 )
-            #     access_key_match = fe or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY") == settings.SDS_API_KEY
+            #     access_key_match = fe or self.api_key == settings.SDS_API_KEY
 
             #     update_search_id(
             #         response_json["newer"],
@@ -430,97 +692,150 @@ class SDSAPIClient:
             raise SDSAPIParamsRequired
 
         try:
-            response = await self.session.post(
-                url="/sds/multipleNewRevisionInfo/",
-                json=search_data,
+            response = await self._request_idempotent(
+                "POST", "/sds/multipleNewRevisionInfo/", json=search_data
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
             raise SDSAPIRequestNotAuthorized
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             if response.content:
                 raise SDSBadRequestException(
-                    response.json().get(
+                    body.get(
                         "error_message", "At least one param is required"
                     )
                 )
             raise SDSBadRequestException
 
-        response_jsons: dict = response.json()
+        response_jsons: dict = body
 
         if response.status_code == status.HTTP_200_OK:
-            for response_json in response_jsons:
-                if response_json["newer"] and response_json["newer"].get(
-                    "sds_id"
-                ):
-                    response_json["newer"]["sds_id"] = encrypt_number(
-                        response_json["newer"]["sds_id"], settings.SECRET_KEY
-                    )
-                if response_json["newer"] and response_json["newer"].get(
-                    "search_id"
-                ):
-                    access_key_match = fe or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY") == settings.SDS_API_KEY
-
-                    update_search_id(
-                        response_json["newer"],
-                        sds_id,
-                        access_key_match,
-                        search_key="search_id",
-                        allow_none=False
-                    )
+            encrypted_ids = encrypted_id_map(sds_id)
+            with span("search_ids"):
+                for response_json in response_jsons:
+                    if response_json["newer"] and response_json["newer"].get(
+                        "sds_id"
+                    ):
+                        response_json["newer"]["sds_id"] = encrypt_number(
+                            response_json["newer"]["sds_id"],
+                            settings.SECRET_KEY,
+                        )
+                    if response_json["newer"] and response_json["newer"].get(
+                        "search_id"
+                    ):
+                        access_key_match = fe or self.api_key == settings.SDS_API_KEY
+
+                        update_search_id(
+                            response_json["newer"],
+                            encrypted_ids,
+                            access_key_match,
+                            search_key="search_id",
+                            allow_none=False
+                        )
 
         return response_jsons
 
-    async def upload_sds(self, files: list[UploadFile], fe: bool = False, sku:str = '', upc_ean:str = '', product_code:str = '', private_import: bool = False, email: str | None = None):
-        try:
-            multipart_files = []
-            for f in files:
-                if f.content_type != "application/pdf":
-                    raise SDSBadRequestException(
-                        "Only PDF files are allowed"
-                    )
-                file_contents = await f.read()
-                if len(file_contents) > settings.SDS_MAX_FILE_SIZE:
-                    raise SDSBadRequestException(
-                        f"File size exceeds the limit of "
-                        f"{settings.SDS_MAX_FILE_SIZE / (1024 * 1024)} MB"
-                    )
-                multipart_files.append(
-                    ("file", (f.filename, file_contents, "application/pdf"))
+    @staticmethod
+    def _multipart_pdfs(files: list[UploadFile]) -> tuple[list, int]:
+        """
+        Multipart "file" fields of the uploaded PDFs, and their total size.
+        Raises `SDSBadRequestException` for a file that is not a PDF or is
+        larger than SDS_MAX_FILE_SIZE.
+        """
+        multipart_files = []
+        total_size = 0
+        for f in files:
+            if f.content_type != "application/pdf":
+                raise SDSBadRequestException(
+                    "Only PDF files are allowed"
+                )
+            # The spooled upload knows its size: reject oversize files
+            # before reading any of them.
+            file_size = upload_file_size(f)
+            if file_size > settings.SDS_MAX_FILE_SIZE:
+                raise SDSBadRequestException(
+                    f"File size exceeds the limit of "
+                    f"{settings.SDS_MAX_FILE_SIZE / (1024 * 1024)} MB"
+                )
+            total_size += file_size
+            # httpx streams file objects into the multipart body in small
+            # chunks instead of holding every file in memory.
+            multipart_files.append(
+                (
+                    "file",
+                    (
+                        f.filename,
+                        SizeLimitedReader(f.file, settings.SDS_MAX_FILE_SIZE),
+                        "application/pdf",
+                    ),
                 )
-            form_data = {
-                "sku": sku,
-                "upc_ean": upc_ean,
-                "product_code": product_code,
-                "private_import": private_import,
-                "email": email,
-                "is_fe": fe,
-            }
-            response = await self.session.post(
-                url="/sds/upload/",
-                timeout=600,
-                files=multipart_files,
-                data=form_data
+            )
+        return multipart_files, total_size
+
+    async def _call_upload(
+        self, send: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """
+        Sends an upload through the circuit breaker. Waiting too long for
+        room in the upload budget is reported as a rate limit.
+        """
+        try:
+            # Uploads are slow by nature: only their errors count.
+            return await self._call_upstream(
+                "/sds/upload/", send, track_latency=False
+            )
+        except asyncio.TimeoutError:
+            raise SDSAPIRateLimitError(
+                "Too many uploads in progress, try again later",
+                retry_after=str(settings.UPLOAD_BUDGET_WAIT_TIMEOUT),
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+    async def upload_sds(self, files: list[UploadFile], fe: bool = False, sku:str = '', upc_ean:str = '', product_code:str = '', private_import: bool = False, email: str | None = None):
+        multipart_files, total_size = self._multipart_pdfs(files)
+        form_data = {
+            "sku": sku,
+            "upc_ean": upc_ean,
+            "product_code": product_code,
+            "private_import": private_import,
+            "email": email,
+            "is_fe": fe,
+        }
+
+        async def send_upload() -> Response:
+            async with self.upload_budget.reserve(
+                total_size, timeout=settings.UPLOAD_BUDGET_WAIT_TIMEOUT
+            ):
+                return await self.session.post(
+                    url="/sds/upload/",
+                    headers=self.auth_headers,
+                    timeout=600,
+                    files=multipart_files,
+                    data=form_data
+                )
+
+        response = await self._call_upload(send_upload)
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
@@ -529,7 +844,7 @@ class SDSAPIClient:
         if response.status_code == status.HTTP_403_FORBIDDEN:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You do not have permission to access this resource"
                     )
                 )
@@ -537,29 +852,28 @@ class SDSAPIClient:
 
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
 
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             if response.content:
                 raise SDSBadRequestException(
-                    response.json().get("error_message", "Bad request, SDS upload failed")
+                    body.get("error_message", "Bad request, SDS upload failed")
                 )
             raise SDSBadRequestException
 
         if response.status_code != status.HTTP_200_OK and response.status_code != status.HTTP_202_ACCEPTED:
             if response.content:
                 raise SDSAPIInternalError(
-                    response.json().get("error_message", "SDS upload failed")
+                    body.get("error_message", "SDS upload failed")
                 )
             raise SDSAPIInternalError
 
-        response_json = response.json()
+        response_json = body
         if response.status_code == status.HTTP_200_OK:
             access_key_match = (
                 fe
-                or self.session.headers.get("SDS-SEARCH-ACCESS-API-KEY")
-                == settings.SDS_API_KEY
+                or self.api_key == settings.SDS_API_KEY
             )
             items = (
                 response_json
@@ -588,17 +902,18 @@ class SDSAPIClient:
             urlParams['email'] = email
         urlParams['id'] = request_id
         try:
-            response = await self.session.get(
-                url="/sds/getExtractionStatus/",
-                params=urlParams
+            response = await self._request_idempotent(
+                "GET", "/sds/getExtractionStatus/", params=urlParams
             )
         except HTTPError:
             raise SDSAPIInternalError
 
+        body = decode_json(response)
+
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
@@ -606,27 +921,30 @@ class SDSAPIClient:
 
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
 
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             raise SDSBadRequestException(
-                response.json().get("error_message", "Default bad request")
+                body.get("error_message", "Default bad request")
             )
 
         if response.status_code != status.HTTP_200_OK:
             raise SDSAPIInternalError
 
-        response_json: dict = response.json()
-        return response_json
+        return body
 
 
-    async def get_sds_safety_information_summary(self, 
+    async def stream_sds_safety_information_summary(self, 
         sds_id: dict | None = None,
         pdf_md5: str | None = None,
         section_display: str | None = None,
         fe: bool = False,
-    ):
+    ) -> Response:
+        """
+        Returns the upstream response with its PDF body not read yet; the
+        caller must consume it with `iter_response_bytes`.
+        """
         payload = {}
         if sds_id:
             payload["sds_id"] = sds_id.get("id")
@@ -638,16 +956,30 @@ class SDSAPIClient:
             raise SDSAPIParamsRequired
 
         try:
-            response = await self.session.post(
-                url="/sds/safetyInformationSummary/",
-                json=payload
+            response = await self._call_upstream(
+                "/sds/safetyInformationSummary/",
+                lambda: self.session.send(
+                    self.session.build_request(
+                        "POST",
+                        url="/sds/safetyInformationSummary/",
+                        headers=self.auth_headers,
+                        json=payload,
+                    ),
+                    stream=True,
+                ),
             )
+            body = {}
+            if response.status_code != status.HTTP_200_OK:
+                # Error bodies are small JSON documents.
+                await response.aread()
+                await response.aclose()
+                body = decode_json(response)
         except HTTPError:
             raise SDSAPIInternalError
         if response.status_code == status.HTTP_401_UNAUTHORIZED:
             if response.content:
                 raise SDSAPIRequestNotAuthorized(
-                    response.json().get(
+                    body.get(
                         "error_message", "You are not authorized"
                     )
                 )
@@ -655,18 +987,62 @@ class SDSAPIClient:
 
         if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
             retry_after = response.headers.get("Retry-After")
-            msg = response.json().get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
+            msg = body.get("error_message", "Rate limit exceeded") if response.content else "Rate limit exceeded"
             raise SDSAPIRateLimitError(msg, retry_after=retry_after)
 
         if response.status_code == status.HTTP_400_BAD_REQUEST:
             if response.content:
                 raise SDSBadRequestException(
-                    response.json().get("error_message", "Default bad request")
+                    body.get("error_message", "Default bad request")
                 )
             raise SDSBadRequestException
 
         if response.status_code != status.HTTP_200_OK:
             raise SDSAPIInternalError
 
-        response_content: bytes = response.content
-        return bytes(response_content)
\ No newline at end of file
+        return response
+
+
+def decode_json(response: Response):
+    """
+    Decodes the body of an upstream response with orjson. Callers decode
+    once and use the result for both their status handling and their
+    return value; coalesced callers share the `Response` and each decode
+    their own copy, which they may modify.
+
+    Error bodies that are empty or not a JSON object decode to {}, so
+    their "error_message" lookups fall back to the defaults. A successful
+    response that is not JSON (e.g. a gateway's HTML page) raises
+    `SDSAPIInternalError`, like an upstream 5xx.
+    """
+    if response.is_success:
+        with span("decode"):
+            try:
+                return orjson.loads(response.content)
+            except orjson.JSONDecodeError:
+                logger.warning(
+                    "SDS API %s answered %d with a body that is not JSON",
+                    response.request.url.path,
+                    response.status_code,
+                )
+                raise SDSAPIInternalError from None
+    try:
+        body = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+async def iter_response_bytes(response: Response) -> AsyncIterator[bytes]:
+    """
+    Yields the body of a streamed upstream response and closes it, also
+    when the consumer stops early (client disconnect).
+    """
+    record = current_record()
+    try:
+        async for chunk in response.aiter_bytes():
+            if record is not None:
+                record.upstream_bytes += len(chunk)
+            yield chunk
+    finally:
+        await response.aclose()
\ No newline at end of file
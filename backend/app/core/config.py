@@ -1,4 +1,5 @@
-from typing import List
+from typing import Dict, List
+from urllib.parse import quote
 
 from dotenv import load_dotenv
 from pydantic import BaseSettings
@@ -20,11 +21,175 @@ class Settings(BaseSettings):
     # /sds/details/. Unset = block stays disabled end to end.
     SDS_GATEWAY_SECRET: str | None = None
     SECRET_KEY: str
+    # Keep decoding Fernet SDS id tokens issued before the deterministic
+    # id codec; turn off once clients no longer hold such tokens.
+    ID_TOKEN_ACCEPT_LEGACY: bool = True
+    # Upstream limit of ids per bulk request; larger gateway requests are
+    # split into chunks of this size, at most BULK_CHUNK_CONCURRENCY of
+    # them in flight at once.
     VALUE_LIMIT: int = 100
+    BULK_MAX_VALUES: int = 5000
+    BULK_CHUNK_CONCURRENCY: int = 4
     REDIS_HOST: str | None = None
     REDIS_PORT: int | None = None
     REDIS_DB: int | None = None
     REDIS_PASSWORD: str | None = None
+    # Connection pool to the upstream SDS API, shared by all API keys of a
+    # worker. HTTP/2 needs the h2 package (httpx[http2]); without it the
+    # pool stays on HTTP/1.1. UPSTREAM_WARM_CONNECTIONS are opened at
+    # startup.
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_WARM_CONNECTIONS: int = 4
+    # Retries of idempotent upstream reads (search, details, revision and
+    # extraction status lookups) on transport errors, 429 and 502-504.
+    # Read timeouts are not retried: each already took SDS_API_TIMEOUT.
+    # MAX_ATTEMPTS counts the first try; a Retry-After longer than
+    # MAX_RETRY_AFTER is passed on to the client instead. Retries of an
+    # endpoint are capped to BUDGET_RATIO of its calls over 10 seconds,
+    # plus BUDGET_MIN_PER_SECOND.
+    UPSTREAM_RETRY_MAX_ATTEMPTS: int = 3
+    UPSTREAM_RETRY_BASE_DELAY: float = 0.2
+    UPSTREAM_RETRY_MAX_DELAY: float = 5
+    UPSTREAM_RETRY_MAX_RETRY_AFTER: float = 10
+    UPSTREAM_RETRY_BUDGET_RATIO: float = 0.2
+    UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND: float = 1
+    # Per-endpoint circuit breaker: over a 10s window of at least
+    # MIN_CALLS calls, a FAILURE_RATE of transport errors and 5xx answers,
+    # or a SLOW_RATE of calls slower than SLOW_CALL_SECONDS, opens the
+    # circuit. Requests then fail with 503 for OPEN_SECONDS, after which
+    # PROBES requests test whether the upstream recovered.
+    UPSTREAM_CIRCUIT_BREAKER_ENABLED: bool = True
+    UPSTREAM_CIRCUIT_FAILURE_RATE: float = 0.5
+    UPSTREAM_CIRCUIT_SLOW_RATE: float = 0.8
+    UPSTREAM_CIRCUIT_SLOW_CALL_SECONDS: float = 30
+    UPSTREAM_CIRCUIT_MIN_CALLS: int = 20
+    UPSTREAM_CIRCUIT_OPEN_SECONDS: float = 30
+    UPSTREAM_CIRCUIT_PROBES: int = 3
+    # Hedged reads: when an upstream call to one of these endpoints takes
+    # longer than the QUANTILE of its recent latencies (at least MIN_DELAY
+    # seconds, once MIN_SAMPLES calls were seen), a second identical call
+    # is sent and the first answer wins. At most MAX_RATE of the calls of
+    # an endpoint are hedged.
+    UPSTREAM_HEDGE_ENABLED: bool = False
+    UPSTREAM_HEDGE_ENDPOINTS: List[str] = ["/sds/search/", "/sds/details/"]
+    UPSTREAM_HEDGE_QUANTILE: float = 0.95
+    UPSTREAM_HEDGE_MIN_DELAY: float = 0.05
+    UPSTREAM_HEDGE_MAX_RATE: float = 0.05
+    UPSTREAM_HEDGE_MIN_SAMPLES: int = 100
     SDS_MAX_FILE_SIZE: int = 5242880  # Default to 5 MB
+    # Bytes of uploads one worker streams upstream at a time; further
+    # uploads wait up to UPLOAD_BUDGET_WAIT_TIMEOUT seconds for room.
+    UPLOAD_INFLIGHT_BYTES_LIMIT: int = 100 * 1024 * 1024
+    UPLOAD_BUDGET_WAIT_TIMEOUT: float = 30
+    # Answer uploads of PDFs already in the database (by MD5) without
+    # sending them through extraction again.
+    UPLOAD_DEDUP_ENABLED: bool = True
+    # Host-wide disk cache of safety information summary PDFs; an empty
+    # PDF_CACHE_DIR disables it.
+    PDF_CACHE_DIR: str | None = "/tmp/sds-pdf-cache"
+    PDF_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # API keys allowed to read the /internal/ diagnostics endpoints.
+    ADMIN_API_KEYS: List[str] = []
+    # /sds/details/ response cache: in-process LRU per worker, backed by
+    # Redis (when configured) so all uvicorn workers share hits.
+    # TTL of 0 disables the cache.
+    DETAILS_CACHE_TTL: int = 300
+    DETAILS_CACHE_MAX_ENTRIES: int = 2048
+    # /sds/search/ result cache, keyed on the normalized query.
+    SEARCH_CACHE_TTL: int = 60
+    SEARCH_CACHE_MAX_ENTRIES: int = 4096
+    REDIS_CACHE_TIMEOUT: float = 0.25
+    # Per-API-key quotas, in cost units per window ("20000/hour"; an empty
+    # limit is unlimited). QUOTA_KEY_TIERS maps API keys, or their access
+    # tier ids ("key-" + first 16 hex chars of the key's SHA-256), to tier
+    # names; other keys get QUOTA_DEFAULT_TIER. Requests cost 1 unit,
+    # except for bulk lookups (per id), uploads (per file) and safety
+    # information summaries. The demo key is limited per IP instead.
+    # Off by default: existing keys had no quota, so map them to tiers
+    # before turning it on.
+    QUOTAS_ENABLED: bool = False
+    QUOTA_TIERS: Dict[str, str] = {
+        "standard": "20000/hour",
+        "bulk": "500000/hour",
+        "unlimited": "",
+    }
+    QUOTA_DEFAULT_TIER: str = "standard"
+    QUOTA_KEY_TIERS: Dict[str, str] = {}
+    QUOTA_COST_BULK_ITEM: int = 1
+    QUOTA_COST_UPLOAD_FILE: int = 20
+    QUOTA_COST_SAFETY_SUMMARY: int = 5
+    # Rate limits are counted in-process and reconciled with Redis every
+    # RATE_LIMIT_SYNC_INTERVAL seconds; a sync slower than
+    # RATE_LIMIT_SYNC_TIMEOUT is given up (limits then hold per worker),
+    # and its hits are not sent again since they may have been counted.
+    # RATE_LIMIT_BATCHED=false checks Redis on every request instead.
+    # At most RATE_LIMIT_MAX_KEYS counters are kept per worker; past that
+    # the oldest windows are dropped.
+    RATE_LIMIT_BATCHED: bool = True
+    RATE_LIMIT_SYNC_INTERVAL: float = 0.25
+    RATE_LIMIT_SYNC_TIMEOUT: float = 1
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    # /sds/extractionStatusStream/: seconds between upstream polls (backing
+    # off towards the max while nothing changes), keep-alive period and
+    # longest life of a stream.
+    EXTRACTION_POLL_MIN_INTERVAL: float = 1
+    EXTRACTION_POLL_MAX_INTERVAL: float = 10
+    EXTRACTION_STREAM_KEEPALIVE: float = 15
+    EXTRACTION_STREAM_MAX_DURATION: float = 30 * 60
+    # Request tracing. Requests made with one of ADMIN_API_KEYS or
+    # TRACING_API_KEYS get a Server-Timing header breaking their time down
+    # (validation, upstream calls, post-processing, serialization). With
+    # an OTLP/HTTP collector endpoint ("http://localhost:4318/v1/traces"),
+    # their spans are exported too, along with a TRACING_SAMPLE_RATE share
+    # of all other requests.
+    TRACING_API_KEYS: List[str] = []
+    TRACING_OTLP_ENDPOINT: str | None = None
+    TRACING_SAMPLE_RATE: float = 0
+    TRACING_SERVICE_NAME: str = "sds-search-gateway"
+    # On-demand profiling: requests made with one of PROFILE_API_KEYS and
+    # an "X-SDS-Profile: html|speedscope|store" header run under a
+    # sampling profiler (one sample per PROFILE_INTERVAL seconds) and get
+    # the profile as their response, or have it stored under PROFILE_DIR.
+    PROFILE_API_KEYS: List[str] = []
+    PROFILE_INTERVAL: float = 0.001
+    PROFILE_DIR: str = "/tmp/sds-profiles"
+    # Event loop lag is sampled every LOOP_MONITOR_INTERVAL seconds; when
+    # the loop is blocked for LOOP_MONITOR_THRESHOLD seconds or more, the
+    # stack of the blocking code is captured (see /internal/loop/).
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.1
+    LOOP_MONITOR_THRESHOLD: float = 0.1
+    # Each worker keeps the FLIGHT_RECORDER_SIZE slowest requests of the
+    # last FLIGHT_RECORDER_WINDOW seconds with their time breakdown (see
+    # /internal/slow-requests/); 0 turns the recorder off. Long-lived
+    # streams are left out.
+    FLIGHT_RECORDER_SIZE: int = 50
+    FLIGHT_RECORDER_WINDOW: float = 900
+    FLIGHT_RECORDER_EXCLUDE_ROUTES: List[str] = [
+        "/sds/extractionStatusStream/"
+    ]
+    # Trust the models SDSService builds from the upstream payload: the
+    # search and details endpoints render them as they are instead of
+    # validating them against their response_model a second time.
+    TRUSTED_UPSTREAM_FAST_MODE: bool = False
+    # /sds/details/ and /sds/multipleDetails/ validate the upstream
+    # documents but pass their extracted_data on as it came, unvalidated
+    # (see passthrough_details).
+    DETAILS_PASSTHROUGH: bool = False
+
+    @property
+    def redis_url(self) -> str | None:
+        if not (self.REDIS_HOST and self.REDIS_PORT and self.REDIS_DB):
+            return None
+        if self.REDIS_PASSWORD:
+            return (
+                f"redis://:{quote(self.REDIS_PASSWORD, '')}@"
+                f"{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
+            )
+        return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
+
 
 settings = Settings()
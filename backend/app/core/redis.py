@@ -0,0 +1,27 @@
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+
+_redis: aioredis.Redis | None = None
+
+
+def get_redis() -> aioredis.Redis | None:
+    """
+    Shared asyncio Redis client of this worker, or None when Redis is not
+    configured. Connections are opened lazily on first use.
+    """
+    global _redis
+    if _redis is None and settings.redis_url:
+        _redis = aioredis.Redis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.REDIS_CACHE_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CACHE_TIMEOUT,
+        )
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
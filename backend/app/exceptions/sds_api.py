@@ -28,3 +28,11 @@ class SDSAPIRateLimitError(Exception):
     def __init__(self, *args, retry_after: str | None = None):
         super().__init__(*args)
         self.retry_after = retry_after
+
+
+class SDSAPIUnavailableError(Exception):
+    """Raised when SDS API is unavailable and requests fail fast"""
+
+    def __init__(self, *args, retry_after: str | None = None):
+        super().__init__(*args)
+        self.retry_after = retry_after
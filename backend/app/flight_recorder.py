@@ -0,0 +1,233 @@
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+
+from app.core.config import settings
+from app.utils import get_access_tier
+
+API_KEY_HEADER = b"x-sds-search-access-api-key"
+# Seconds between purges of the entries older than the window.
+PURGE_INTERVAL = 10
+
+_record: ContextVar["RequestRecord | None"] = ContextVar(
+    "request_record", default=None
+)
+
+
+class RequestRecord:
+    """
+    Timings and sizes of one request, filled in as it goes by the route
+    (`TracedRoute`) and the upstream client, for `FlightRecorder`.
+    """
+
+    __slots__ = (
+        "method",
+        "api_key",
+        "request_bytes",
+        "start",
+        "route",
+        "status",
+        "response_bytes",
+        "validate",
+        "endpoint",
+        "serialize",
+        "upstream",
+        "upstream_calls",
+        "upstream_endpoint",
+        "upstream_status",
+        "upstream_bytes",
+        "_in_flight",
+        "_upstream_since",
+    )
+
+    def __init__(self, method: str, api_key: bytes | None, request_bytes):
+        self.method = method
+        # Only kept to derive the access tier of recorded requests.
+        self.api_key = api_key
+        self.request_bytes = request_bytes
+        self.start = time.perf_counter()
+        self.route = None
+        self.status = None
+        self.response_bytes = 0
+        self.validate = None
+        self.endpoint = None
+        self.serialize = None
+        # Seconds with at least one upstream call in flight.
+        self.upstream = 0.0
+        self.upstream_calls = 0
+        self.upstream_endpoint = None
+        self.upstream_status = None
+        self.upstream_bytes = 0
+        self._in_flight = 0
+        self._upstream_since = 0.0
+
+    def upstream_started(self) -> None:
+        if not self._in_flight:
+            self._upstream_since = time.perf_counter()
+        self._in_flight += 1
+
+    def upstream_finished(self, endpoint: str, status, size: int) -> None:
+        self._in_flight -= 1
+        if not self._in_flight:
+            self.upstream += time.perf_counter() - self._upstream_since
+        self.upstream_calls += 1
+        self.upstream_endpoint = endpoint
+        self.upstream_status = status
+        self.upstream_bytes += size
+
+    def route_timings(self, start: float, marks: list, end: float) -> None:
+        """
+        Splits the route's time at the start and end of its endpoint.
+        """
+        self.validate = (marks[0] if marks else end) - start
+        if len(marks) == 2:
+            self.endpoint = marks[1] - marks[0]
+            self.serialize = end - marks[1]
+
+    def to_dict(self, total: float, finished_at: float) -> dict:
+        def ms(seconds: float | None) -> float | None:
+            return None if seconds is None else round(seconds * 1000, 2)
+
+        if self.api_key:
+            access_tier = get_access_tier(self.api_key.decode("latin-1"))
+        else:
+            access_tier = "demo"
+        return {
+            "finished_at": time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(finished_at)
+            ),
+            "method": self.method,
+            "route": self.route,
+            "status": self.status,
+            "access_tier": access_tier,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "upstream": {
+                "endpoint": self.upstream_endpoint,
+                "status": self.upstream_status,
+                "calls": self.upstream_calls,
+                "bytes": self.upstream_bytes,
+            },
+            "timings_ms": {
+                "total": ms(total),
+                "validate": ms(self.validate),
+                "upstream": ms(self.upstream),
+                # Endpoint time not spent waiting on the upstream:
+                # SDSService post-processing, quota checks, retry backoff.
+                "service": ms(
+                    None
+                    if self.endpoint is None
+                    else max(0.0, self.endpoint - self.upstream)
+                ),
+                "serialize": ms(self.serialize),
+            },
+        }
+
+
+def current_record() -> RequestRecord | None:
+    return _record.get()
+
+
+class FlightRecorder:
+    """
+    The `size` slowest requests of the last `window` seconds, per worker.
+
+    A request is only turned into an entry if it is slower than the
+    fastest one kept (a min-heap), so the fast path is a comparison.
+    Entries are stored with the access tier of their API key, never the
+    key itself.
+    """
+
+    def __init__(self, size: int, window: float):
+        self.size = size
+        self.window = window
+        # (total seconds, sequence, finished at, entry)
+        self._heap: list[tuple] = []
+        self._sequence = itertools.count()
+        self._purged_at = time.monotonic()
+        self.recorded = 0
+
+    def _purge(self, now: float) -> None:
+        self._purged_at = now
+        oldest = time.time() - self.window
+        kept = [item for item in self._heap if item[2] >= oldest]
+        if len(kept) != len(self._heap):
+            heapq.heapify(kept)
+            self._heap = kept
+
+    def offer(self, record: RequestRecord, total: float) -> None:
+        now = time.monotonic()
+        if now - self._purged_at > PURGE_INTERVAL:
+            self._purge(now)
+        full = len(self._heap) >= self.size
+        if full and total <= self._heap[0][0]:
+            return
+        finished_at = time.time()
+        item = (
+            total,
+            next(self._sequence),
+            finished_at,
+            record.to_dict(total, finished_at),
+        )
+        self.recorded += 1
+        if full:
+            heapq.heapreplace(self._heap, item)
+        else:
+            heapq.heappush(self._heap, item)
+
+    def entries(self) -> list[dict]:
+        self._purge(time.monotonic())
+        return [item[3] for item in sorted(self._heap, reverse=True)]
+
+
+flight_recorder = FlightRecorder(
+    size=settings.FLIGHT_RECORDER_SIZE,
+    window=settings.FLIGHT_RECORDER_WINDOW,
+)
+
+
+class FlightRecorderMiddleware:
+    """
+    Keeps a `RequestRecord` of every request and offers the finished ones
+    to the flight recorder; routes in FLIGHT_RECORDER_EXCLUDE_ROUTES
+    (long-lived streams) are left out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or flight_recorder.size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        api_key = request_bytes = None
+        for name, value in scope["headers"]:
+            if name == API_KEY_HEADER:
+                api_key = value
+            elif name == b"content-length" and value.isdigit():
+                request_bytes = int(value)
+        record = RequestRecord(scope["method"], api_key, request_bytes)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record.status = message["status"]
+            elif message["type"] == "http.response.body":
+                record.response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        token = _record.set(record)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _record.reset(token)
+            route = scope.get("route")
+            record.route = getattr(route, "path", None)
+            if (
+                record.route is not None
+                and record.route not in settings.FLIGHT_RECORDER_EXCLUDE_ROUTES
+            ):
+                flight_recorder.offer(
+                    record, time.perf_counter() - record.start
+                )
@@ -0,0 +1,125 @@
+import base64
+import functools
+import struct
+from typing import Iterable
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app.core.config import settings
+
+# One AES block holding the id followed by 8 zero bytes, urlsafe base64
+# without padding. Legacy Fernet tokens are 100+ chars.
+TOKEN_LENGTH = 22
+_BLOCK = struct.Struct(">Q8s")
+_REDUNDANCY = bytes(8)
+
+
+class IDCodec:
+    """
+    Turns SDS ids into opaque tokens and back.
+
+    A token is the single-block AES encryption of the 8-byte id padded
+    with 8 zero bytes. It is deterministic (the same id always gives the
+    same token, so responses stay cacheable) and authenticated: AES is a
+    keyed permutation, so a forged or corrupted token decrypts to a block
+    whose padding is zero with probability 2**-64. The block cipher
+    contexts are built once per key and recent results are memoized, so
+    repeated ids in a page cost a dict lookup.
+
+    Fernet tokens issued before this codec are still accepted by `decode`
+    while `accept_legacy` is set.
+    """
+
+    def __init__(
+        self, key: str | bytes, accept_legacy: bool = True, cache_size=65536
+    ):
+        if isinstance(key, str):
+            key = key.encode()
+        self._fernet = Fernet(key)
+        cipher = Cipher(
+            algorithms.AES(
+                HKDF(
+                    algorithm=hashes.SHA256(),
+                    length=32,
+                    salt=None,
+                    info=b"sds-gateway id token v1",
+                ).derive(key)
+            ),
+            modes.ECB(),
+        )
+        # ECB contexts keep no state between whole blocks, so a single
+        # encryptor/decryptor serves every call.
+        self._encryptor = cipher.encryptor()
+        self._decryptor = cipher.decryptor()
+        self.accept_legacy = accept_legacy
+        self.encode = functools.lru_cache(maxsize=cache_size)(self._encode)
+        self.decode = functools.lru_cache(maxsize=cache_size)(self._decode)
+
+    def _encode(self, number: int) -> str:
+        if isinstance(number, float):
+            # int() would silently truncate it to some other SDS's id.
+            if not number.is_integer():
+                raise ValueError(f"Not an integral id: {number!r}")
+            number = int(number)
+        try:
+            block = self._encryptor.update(
+                _BLOCK.pack(int(number), _REDUNDANCY)
+            )
+        except (TypeError, ValueError, struct.error):
+            # Not an SDS id (e.g. an upload request id): fall back to the
+            # legacy Fernet token, as before this codec.
+            return self._fernet.encrypt(str(number).encode()).decode()
+        return self._b64(block)
+
+    @staticmethod
+    def _b64(block: bytes) -> str:
+        return base64.urlsafe_b64encode(block).rstrip(b"=").decode()
+
+    def _decode(self, token: str | bytes) -> int:
+        if isinstance(token, bytes):
+            token = token.decode()
+        if len(token) != TOKEN_LENGTH:
+            return self._decode_legacy(token)
+        try:
+            block = base64.urlsafe_b64decode(token + "==")
+        except ValueError:  # binascii.Error included
+            raise InvalidToken from None
+        # A partial block would stay buffered in the shared decryptor, and
+        # only the canonical encoding of a block is a valid token.
+        if len(block) != 16 or self._b64(block) != token:
+            raise InvalidToken
+        number, redundancy = _BLOCK.unpack(self._decryptor.update(block))
+        if redundancy != _REDUNDANCY:
+            raise InvalidToken
+        return number
+
+    def _decode_legacy(self, token: str) -> int:
+        if not self.accept_legacy:
+            raise InvalidToken
+        try:
+            return int(self._fernet.decrypt(token.encode()).decode())
+        except ValueError:
+            raise InvalidToken
+
+    def encode_many(self, numbers: Iterable[int]) -> list[str]:
+        encode = self.encode
+        return [encode(number) for number in numbers]
+
+    def decode_many(self, tokens: Iterable[str | bytes]) -> list[int]:
+        """
+        Decodes every token, raising `InvalidToken` on the first bad one.
+        """
+        decode = self.decode
+        return [decode(token) for token in tokens]
+
+
+@functools.lru_cache(maxsize=8)
+def get_codec(key: str | bytes) -> IDCodec:
+    return IDCodec(key, accept_legacy=settings.ID_TOKEN_ACCEPT_LEGACY)
+
+
+def get_default_codec() -> IDCodec:
+    return get_codec(settings.SECRET_KEY)
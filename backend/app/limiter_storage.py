@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from limits.storage import Storage
+from redis.exceptions import RedisError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Adds each worker's pending hits to the shared counters and returns the
+# resulting totals and their remaining TTLs, for all keys in one round trip.
+# ARGV holds (amount, expiry) pairs matching KEYS.
+SYNC_SCRIPT = """
+local result = {}
+for i, key in ipairs(KEYS) do
+    local amount = tonumber(ARGV[2 * i - 1])
+    local expiry = tonumber(ARGV[2 * i])
+    local value = redis.call('INCRBY', key, amount)
+    local ttl = redis.call('PTTL', key)
+    if ttl < 0 then
+        redis.call('EXPIRE', key, expiry)
+        ttl = expiry * 1000
+    end
+    result[2 * i - 1] = value
+    result[2 * i] = ttl
+end
+return result
+"""
+
+
+class _Counter:
+    __slots__ = ("expires_at", "synced", "pending")
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+        # Total of all workers as of the last sync, and hits of this
+        # worker not sent to Redis yet.
+        self.synced = 0
+        self.pending = 0
+
+    @property
+    def value(self) -> int:
+        return self.synced + self.pending
+
+
+class BatchedRedisStorage(Storage):
+    """
+    `limits` storage for slowapi that never blocks the event loop.
+
+    slowapi checks limits synchronously, so this storage answers from
+    in-process counters: the fixed window of each key holds the total of
+    all workers as of the last sync plus this worker's hits since. A
+    background task sends the hits of every key touched since the last
+    sync to Redis every RATE_LIMIT_SYNC_INTERVAL seconds, in one atomic
+    script, and takes back the shared totals and window expiries.
+
+    Between syncs each worker only sees its own new hits, so a burst
+    spread over several workers can exceed a limit by what they admit in
+    one interval. If Redis is not configured or fails, the pending hits
+    are kept for the next sync and the limits hold per worker meanwhile
+    (fail-open). A sync that times out (RATE_LIMIT_SYNC_TIMEOUT) may have
+    run on Redis all the same, so its hits are not sent again: they only
+    count in this worker, rather than twice in every one.
+
+    Counters of ended windows are purged every PURGE_INTERVAL seconds,
+    and at most RATE_LIMIT_MAX_KEYS are kept: past that the oldest
+    windows are dropped, pending hits included, which again fails open.
+
+    Use it with the storage URI "batched://"; it talks to Redis through
+    the app's shared client (`app.core.redis`).
+    """
+
+    STORAGE_SCHEME = ["batched"]
+    KEY_PREFIX = "sds-gateway:limits:"
+    PURGE_INTERVAL = 10
+
+    def __init__(self, uri: str | None = None, **options):
+        super().__init__(uri, **options)
+        self._counters: dict[str, _Counter] = {}
+        self._dirty: set[str] = set()
+        self._task: asyncio.Task | None = None
+        self._script = None
+        self._purged_at = time.time()
+        self.syncs = 0
+        self.sync_failures = 0
+        self.synced_keys = 0
+        self.dropped_keys = 0
+
+    @property
+    def base_exceptions(self):
+        return RedisError
+
+    def _counter(self, key: str, now: float) -> _Counter | None:
+        counter = self._counters.get(key)
+        if counter is not None and counter.expires_at <= now:
+            del self._counters[key]
+            return None
+        return counter
+
+    def _purge(self, now: float) -> None:
+        """
+        Deletes the counters of ended windows, then the oldest ones if
+        RATE_LIMIT_MAX_KEYS are still left.
+        """
+        self._purged_at = now
+        expired = [
+            key
+            for key, counter in self._counters.items()
+            if counter.expires_at <= now
+        ]
+        for key in expired:
+            self.clear(key)
+        if len(self._counters) >= settings.RATE_LIMIT_MAX_KEYS:
+            # Down to 90%, so that each new key does not purge again. Dicts
+            # keep insertion order: the first keys are the oldest windows.
+            excess = len(self._counters) - int(
+                settings.RATE_LIMIT_MAX_KEYS * 0.9
+            )
+            for key in list(itertools.islice(self._counters, excess)):
+                self.clear(key)
+            self.dropped_keys += excess
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        counter = self._counter(key, now)
+        if counter is None:
+            if (
+                now - self._purged_at >= self.PURGE_INTERVAL
+                or len(self._counters) >= settings.RATE_LIMIT_MAX_KEYS
+            ):
+                self._purge(now)
+            counter = self._counters[key] = _Counter(now + expiry)
+        counter.pending += amount
+        self._dirty.add(key)
+        self._ensure_sync_task()
+        return counter.value
+
+    def get(self, key: str) -> int:
+        counter = self._counter(key, time.time())
+        return counter.value if counter else 0
+
+    def get_expiry(self, key: str) -> float:
+        counter = self._counter(key, time.time())
+        return counter.expires_at if counter else time.time()
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> int | None:
+        count = len(self._counters)
+        self._counters.clear()
+        self._dirty.clear()
+        return count
+
+    def clear(self, key: str) -> None:
+        self._counters.pop(key, None)
+        self._dirty.discard(key)
+
+    def _ensure_sync_task(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        if get_redis() is None:
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(
+                self._sync_loop()
+            )
+        except RuntimeError:
+            pass  # no running event loop: counters stay local
+
+    async def _sync_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(settings.RATE_LIMIT_SYNC_INTERVAL)
+            await self.sync()
+
+    async def sync(self) -> None:
+        """
+        Pushes the pending hits to Redis and refreshes the counters of the
+        keys involved with the shared totals.
+        """
+        redis = get_redis()
+        if redis is None or not self._dirty:
+            return
+        now = time.time()
+        batch = []
+        for key in self._dirty:
+            counter = self._counter(key, now)
+            if counter is not None and counter.pending:
+                batch.append((key, counter, counter.pending))
+        self._dirty.clear()
+        if not batch:
+            return
+        if self._script is None:
+            self._script = redis.register_script(SYNC_SCRIPT)
+
+        args = []
+        for _, counter, pending in batch:
+            args += [pending, max(1, round(counter.expires_at - now))]
+        try:
+            result = await asyncio.wait_for(
+                self._script(
+                    keys=[self.KEY_PREFIX + key for key, _, _ in batch],
+                    args=args,
+                    client=redis,
+                ),
+                settings.RATE_LIMIT_SYNC_TIMEOUT,
+            )
+        except (RedisTimeoutError, asyncio.TimeoutError) as e:
+            self.sync_failures += 1
+            for _, counter, pending in batch:
+                counter.pending -= pending
+                counter.synced += pending
+            logger.warning("Rate limit sync with Redis timed out: %r", e)
+            return
+        except RedisError as e:
+            self.sync_failures += 1
+            self._dirty.update(key for key, _, _ in batch)
+            logger.warning("Rate limit sync with Redis failed: %r", e)
+            return
+
+        self.syncs += 1
+        self.synced_keys += len(batch)
+        now = time.time()
+        for i, (key, counter, pending) in enumerate(batch):
+            if self._counters.get(key) is not counter:
+                continue  # the window ended meanwhile
+            total, ttl_ms = int(result[2 * i]), int(result[2 * i + 1])
+            counter.pending -= pending
+            counter.synced = total
+            counter.expires_at = now + ttl_ms / 1000
+
+    async def close(self) -> None:
+        """
+        Stops the sync task after sending the hits still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.sync()
+        except Exception as e:
+            logger.warning("Final rate limit sync failed: %r", e)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._counters),
+            "pending_keys": len(self._dirty),
+            "syncs": self.syncs,
+            "synced_keys": self.synced_keys,
+            "sync_failures": self.sync_failures,
+            "dropped_keys": self.dropped_keys,
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from app.core.config import settings
+from app.metrics import LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+# Lag samples kept for the percentiles, and blocking call sites kept.
+LAG_SAMPLES = 2048
+MAX_BLOCKING_SITES = 100
+# Frames of a captured stack reported per call site.
+STACK_DEPTH = 20
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# App modules whose middlewares and route wrappers sit on every request's
+# stack: the code that blocked is further in.
+WRAPPER_MODULES = {
+    os.path.join(APP_DIR, *path.split("/"))
+    for path in (
+        "flight_recorder.py",
+        "metrics.py",
+        "profiling.py",
+        "tracing.py",
+        "api/routing.py",
+    )
+}
+
+
+class _BlockingSite:
+    __slots__ = ("stalls", "blocked_seconds", "max_seconds", "stack")
+
+    def __init__(self, stack: list[str]):
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self.max_seconds = 0.0
+        self.stack = stack
+
+
+def _call_site(frames: traceback.StackSummary) -> str:
+    """
+    Innermost frame of the app's own code in a stack (the code that made
+    the blocking call), leaving out the `WRAPPER_MODULES`. If there is
+    none, the innermost frame, followed by the innermost app frame as
+    context when there is one (e.g. a blocking call in the framework,
+    under a middleware).
+    """
+    wrapper = None
+    for frame in reversed(frames):
+        if not frame.filename.startswith(APP_DIR):
+            continue
+        path = os.path.relpath(frame.filename, os.path.dirname(APP_DIR))
+        site = f"{path}:{frame.lineno} in {frame.name}"
+        if frame.filename not in WRAPPER_MODULES:
+            return site
+        wrapper = wrapper or site
+    frame = frames[-1]
+    site = f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return f"{site} (under {wrapper})" if wrapper else site
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs its callbacks and finds the code
+    that holds it up.
+
+    A task sleeps `interval` seconds at a time and records how much later
+    than due it wakes up (the loop lag). A watchdog thread checks on that
+    task every `threshold / 2` seconds: once it is `threshold` seconds
+    overdue, the loop is stuck in some synchronous code, and the thread
+    captures the loop thread's stack. When the loop gets free, the stall
+    is added to the call site the stack was captured in.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._loop_thread_id: int | None = None
+        # When the lag task is due to wake up next.
+        self._due = 0.0
+        # Stack captured by the watchdog for the stall in progress, and
+        # the wake-up it was captured for.
+        self._captured: traceback.StackSummary | None = None
+        self._captured_for = 0.0
+        self._lags = [0.0] * LAG_SAMPLES
+        self._samples = 0
+        self.stalls = 0
+        self.unattributed_stalls = 0
+        self.max_lag = 0.0
+        self._sites: dict[str, _BlockingSite] = {}
+
+    def start(self) -> None:
+        """
+        Starts monitoring the running loop (call from its thread).
+        """
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._due = time.monotonic() + self.interval
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _run(self) -> None:
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, time.monotonic() - self._due))
+
+    def _record(self, lag: float) -> None:
+        self._lags[self._samples % LAG_SAMPLES] = lag
+        self._samples += 1
+        self.max_lag = max(self.max_lag, lag)
+        LOOP_LAG.observe(lag)
+        if lag < self.threshold:
+            return
+        self.stalls += 1
+        stack = self._captured
+        self._captured = None
+        if stack is None or self._captured_for != self._due:
+            # Too short for the watchdog to catch it in the act.
+            self.unattributed_stalls += 1
+            return
+        self._add_to_site(stack, lag)
+
+    def _add_to_site(self, stack: traceback.StackSummary, lag: float):
+        site_key = _call_site(stack)
+        site = self._sites.get(site_key)
+        if site is None:
+            if len(self._sites) >= MAX_BLOCKING_SITES:
+                # Make room by forgetting the site that blocked the least.
+                del self._sites[
+                    min(
+                        self._sites,
+                        key=lambda key: self._sites[key].blocked_seconds,
+                    )
+                ]
+            site = self._sites[site_key] = _BlockingSite(
+                [line.rstrip() for line in stack.format()[-STACK_DEPTH:]]
+            )
+        site.stalls += 1
+        site.blocked_seconds += lag
+        site.max_seconds = max(site.max_seconds, lag)
+        logger.debug("Event loop blocked for %.3fs at %s", lag, site_key)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            due = self._due
+            if time.monotonic() - due < self.threshold:
+                continue
+            if self._captured_for == due and self._captured is not None:
+                continue  # this stall's stack is already captured
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._captured = traceback.extract_stack(frame)
+            self._captured_for = due
+
+    def lag_percentiles(self) -> dict:
+        count = min(self._samples, LAG_SAMPLES)
+        lags = sorted(self._lags[:count])
+
+        def ms(q: float) -> float | None:
+            if not lags:
+                return None
+            return round(lags[min(count - 1, int(q * count))] * 1000, 2)
+
+        return {
+            "samples": count,
+            "p50_ms": ms(0.5),
+            "p90_ms": ms(0.9),
+            "p99_ms": ms(0.99),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+    def stats(self, top: int = 10) -> dict:
+        sites = sorted(
+            self._sites.items(),
+            key=lambda item: item[1].blocked_seconds,
+            reverse=True,
+        )[:top]
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag": self.lag_percentiles(),
+            "stalls": self.stalls,
+            "unattributed_stalls": self.unattributed_stalls,
+            "blocking_sites": [
+                {
+                    "site": key,
+                    "stalls": site.stalls,
+                    "blocked_ms": round(site.blocked_seconds * 1000, 1),
+                    "max_ms": round(site.max_seconds * 1000, 1),
+                    "stack": site.stack,
+                }
+                for key, site in sites
+            ],
+        }
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL,
+    threshold=settings.LOOP_MONITOR_THRESHOLD,
+)
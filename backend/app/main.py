@@ -1,28 +1,52 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
+from app.api.internal import router as internal_api_router
+from app.api.metrics import router as metrics_router
 from app.api.sds import router as sds_api_router
 from app.clients.sds_api_client import SDSAPIClient
 from app.core.config import settings
+from app.core.redis import close_redis
+from app.flight_recorder import FlightRecorderMiddleware
+from app.loop_monitor import loop_monitor
+from app.metrics import MetricsMiddleware, mark_worker_dead, pool_metrics_loop
 
-from app.throttling import limiter
-from app.exceptions.sds_api import SDSBadRequestException
+from app.profiling import ProfilerMiddleware
+from app.quotas import close_quotas
+from app.throttling import close_limiter, limiter
+from app.tracing import TracingMiddleware, close_tracing
+from app.exceptions.sds_api import (
+    SDSAPIUnavailableError,
+    SDSBadRequestException,
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    if settings.SDS_API_KEY:
-        SDSAPIClient.get_or_create_client(settings.SDS_API_KEY)
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    await SDSAPIClient.warm_up()
+    pool_metrics = asyncio.create_task(
+        pool_metrics_loop(SDSAPIClient.pool_stats)
+    )
     yield
-    await SDSAPIClient.close_all_clients()
+    pool_metrics.cancel()
+    await loop_monitor.stop()
+    mark_worker_dead()
+    await SDSAPIClient.close_shared_client()
+    await close_limiter()
+    await close_quotas()
+    await close_tracing()
+    await close_redis()
 
 
 app = FastAPI(
@@ -30,10 +54,13 @@ app = FastAPI(
     title="SDS Search Service",
     description="The SDS Manager API is designed to streamline the search process for Safety Data Sheets (SDS). This powerful tool allows users to efficiently locate SDS documents by querying product names, CAS numbers, or supplier details. The API ensures that users have quick access to critical safety information, helping maintain compliance with safety regulations. Its robust search capabilities enable integration into various systems, making it an essential resource for industries that handle hazardous materials. <p><b>You should to fill API key first in Authorize button.<b/><p>",
     docs_url="/docs",
+    # Renders the responses with orjson instead of the stdlib encoder.
+    default_response_class=ORJSONResponse,
 )
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+app.add_middleware(ProfilerMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -41,8 +68,14 @@ app.add_middleware(
     allow_methods=settings.CORS_ALLOW_METHODS,
     allow_headers=settings.CORS_ALLOW_HEADERS,
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(FlightRecorderMiddleware)
+# Added last so that it is outermost and times the whole request.
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(sds_api_router, tags=["SDS API"])
+app.include_router(internal_api_router)
+app.include_router(metrics_router)
 
 
 @app.exception_handler(500)
@@ -62,6 +95,19 @@ async def bad_request_exception_handler(request: Request, exc: SDSBadRequestExce
     )
 
 
+@app.exception_handler(SDSAPIUnavailableError)
+async def unavailable_exception_handler(
+    request: Request, exc: SDSAPIUnavailableError
+):
+    return JSONResponse(
+        status_code=503,
+        content=jsonable_encoder(
+            {"detail": str(exc) or "SDS API is temporarily unavailable"}
+        ),
+        headers={"Retry-After": exc.retry_after} if exc.retry_after else None,
+    )
+
+
 @app.get("/")
 def get_root():
     """
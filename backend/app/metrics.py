@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# uvicorn runs several worker processes: with PROMETHEUS_MULTIPROC_DIR set
+# (before this module is imported), each one writes its samples to files
+# in that directory and /metrics aggregates the files of all workers. The
+# directory must be emptied before the workers start.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+)
+# 256 bytes to 16 MiB.
+SIZE_BUCKETS = tuple(256 * 4**i for i in range(9))
+# Seconds between updates of the connection pool gauges.
+POOL_METRICS_INTERVAL = 5
+
+REQUEST_LATENCY = Histogram(
+    "sds_gateway_request_duration_seconds",
+    "Time to serve a request, until the last byte of its response.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "sds_gateway_response_size_bytes",
+    "Size of response bodies.",
+    ["route"],
+    buckets=SIZE_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "sds_gateway_upstream_request_duration_seconds",
+    "Time to the response headers of upstream SDS API calls, by upstream "
+    "endpoint and status code ('error' for transport errors, 'rejected' "
+    "when the circuit breaker refused the call).",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "sds_gateway_rate_limit_decisions_total",
+    "Rate limit checks by limiter ('ip' or 'quota') and decision.",
+    ["limiter", "decision"],
+)
+LOOP_LAG = Histogram(
+    "sds_gateway_event_loop_lag_seconds",
+    "How late the event loop ran a timer callback, sampled periodically.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+POOL_CONNECTIONS = Gauge(
+    "sds_gateway_upstream_pool_connections",
+    "Connections of the upstream connection pools by state.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+POOL_QUEUED_REQUESTS = Gauge(
+    "sds_gateway_upstream_pool_queued_requests",
+    "Requests waiting for an upstream connection.",
+    multiprocess_mode="livesum",
+)
+POOL_MAX_CONNECTIONS = Gauge(
+    "sds_gateway_upstream_pool_max_connections",
+    "Connection limit of the upstream connection pools.",
+    multiprocess_mode="livesum",
+)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, status and body size of every HTTP request,
+    labelled with the route template ("/sds/details/") rather than the
+    raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(
+                scope["method"], route_path, str(status_code)
+            ).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(route_path).observe(size)
+
+
+async def observe_upstream(endpoint: str, send):
+    """
+    Awaits `send()`, an upstream call, recording its latency and status.
+    """
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = await send()
+        status = str(response.status_code)
+        return response
+    finally:
+        UPSTREAM_LATENCY.labels(endpoint, status).observe(
+            time.perf_counter() - start
+        )
+
+
+def update_pool_metrics(stats: dict) -> None:
+    for state in ("active", "idle"):
+        POOL_CONNECTIONS.labels(state).set(stats.get(state) or 0)
+    POOL_QUEUED_REQUESTS.set(stats.get("queued_requests") or 0)
+    POOL_MAX_CONNECTIONS.set(stats.get("max_connections") or 0)
+
+
+async def pool_metrics_loop(get_stats) -> None:
+    while True:
+        update_pool_metrics(get_stats())
+        await asyncio.sleep(POOL_METRICS_INTERVAL)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead() -> None:
+    """
+    Drops the live gauges of this worker when it shuts down.
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PDFDiskCache:
+    """
+    On-disk cache of generated PDFs, shared by every worker on the host.
+
+    Each key maps to a file named after the SHA-256 of the key. Files are
+    written to a temporary name while they stream and renamed into place
+    once complete, so readers never see a partial PDF. The least recently
+    used files are evicted once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str | None, max_bytes: int):
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and self.max_bytes > 0
+
+    def path_for(self, key: tuple) -> Path:
+        digest = hashlib.sha256(
+            json.dumps(key, default=str).encode()
+        ).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.pdf"
+
+    def lookup(self, key: tuple) -> BinaryIO | None:
+        """
+        Returns the cached file opened for reading. The open file stays
+        readable even if `evict` unlinks it before it has been served.
+        """
+        if not self.enabled:
+            return None
+        try:
+            file = open(self.path_for(key), "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # mtime doubles as the last access time for eviction.
+        os.utime(file.fileno())
+        self.hits += 1
+        return file
+
+    async def write_through(
+        self, key: tuple, chunks: AsyncIterator[bytes]
+    ) -> AsyncIterator[bytes]:
+        """
+        Passes `chunks` through while storing them under `key`. Nothing is
+        stored unless the stream is consumed to the end.
+        """
+        if not self.enabled:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        path = self.path_for(key)
+        fd, tmp_name = await run_in_threadpool(self._create_temp, path)
+        tmp = os.fdopen(fd, "wb")
+        completed = False
+        try:
+            async for chunk in chunks:
+                await run_in_threadpool(tmp.write, chunk)
+                yield chunk
+            await run_in_threadpool(self._commit, tmp, tmp_name, path)
+            completed = True
+        finally:
+            if not completed:
+                # Inline: this also runs when the client has gone away and
+                # the generator is closed, where awaiting is not possible.
+                tmp.close()
+                try:
+                    os.unlink(tmp_name)
+                except FileNotFoundError:
+                    pass
+        self.stores += 1
+        # Scan for eviction off the response path.
+        asyncio.get_running_loop().run_in_executor(None, self.evict)
+
+    @staticmethod
+    def _create_temp(path: Path) -> tuple[int, str]:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkstemp(dir=path.parent, suffix=".part")
+
+    @staticmethod
+    def _commit(tmp: BinaryIO, tmp_name: str, path: Path) -> None:
+        tmp.close()
+        os.replace(tmp_name, path)
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for path in self.directory.glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% so that every store does not trigger a scan
+        # that deletes a single file.
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= size
+            self.evictions += 1
+        logger.info("Evicted PDF cache down to %d bytes", total)
+
+    def stats(self) -> dict:
+        return {
+            "directory": str(self.directory) if self.directory else None,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+safety_summary_cache = PDFDiskCache(
+    directory=settings.PDF_CACHE_DIR,
+    max_bytes=settings.PDF_CACHE_MAX_BYTES,
+)
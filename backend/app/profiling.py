@@ -0,0 +1,147 @@
+import logging
+import os
+import secrets
+import time
+
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-sds-profile"
+API_KEY_HEADER = b"x-sds-search-access-api-key"
+# X-SDS-Profile values: answer with the profile instead of the response
+# (as an HTML report or a speedscope JSON document), or store the HTML
+# report under PROFILE_DIR and answer as usual.
+PROFILE_CONTENT_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "speedscope": "application/json",
+}
+STORE = "store"
+
+
+def _profile_mode(scope) -> str | None:
+    mode = api_key = None
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            mode = value.decode("latin-1").strip().lower()
+        elif name == API_KEY_HEADER:
+            api_key = value.decode("latin-1")
+    if api_key not in settings.PROFILE_API_KEYS:
+        return None
+    if mode != STORE and mode not in PROFILE_CONTENT_TYPES:
+        return None
+    return mode
+
+
+def _profile_file_name(path: str) -> str:
+    return (
+        f"{time.strftime('%Y%m%dT%H%M%S')}-"
+        f"{path.strip('/').replace('/', '_') or 'root'}-"
+        f"{os.getpid()}-{secrets.token_hex(4)}.html"
+    )
+
+
+def _write_profile(profiler: Profiler, file_name: str) -> None:
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(settings.PROFILE_DIR, file_name), "w") as f:
+        f.write(profiler.output_html())
+
+
+def _render_profile(profiler: Profiler, mode: str) -> bytes:
+    if mode == "speedscope":
+        return profiler.output(renderer=SpeedscopeRenderer()).encode()
+    return profiler.output_html().encode()
+
+
+class ProfilerMiddleware:
+    """
+    Runs single requests under pyinstrument's sampling profiler, on
+    demand: requests made with one of PROFILE_API_KEYS and an
+    X-SDS-Profile header. The profile covers the whole request, from the
+    API key dependency and the validation of the body to the upstream
+    calls and the serialization of the response.
+
+    The profiler follows the request's own task (async mode), so requests
+    served concurrently by the worker do not show in its profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILE_API_KEYS:
+            await self.app(scope, receive, send)
+            return
+        mode = _profile_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = Profiler(
+            interval=settings.PROFILE_INTERVAL, async_mode="enabled"
+        )
+        if mode == STORE:
+            await self._profile_and_store(profiler, scope, receive, send)
+        else:
+            await self._profile_and_return(
+                profiler, mode, scope, receive, send
+            )
+
+    async def _profile_and_store(self, profiler, scope, receive, send):
+        # Named up front: the response headers go out before it ends.
+        file_name = _profile_file_name(scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"x-sds-profile-file", file_name.encode()),
+                    ],
+                }
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            try:
+                await run_in_threadpool(_write_profile, profiler, file_name)
+            except OSError as e:
+                logger.warning("Storing profile %s failed: %r", file_name, e)
+
+    async def _profile_and_return(self, profiler, mode, scope, receive, send):
+        status_code = 500
+
+        async def discard(message):
+            # The response is replaced by the profile; only its status is
+            # kept, in the X-SDS-Profiled-Status header.
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+        body = await run_in_threadpool(_render_profile, profiler, mode)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", PROFILE_CONTENT_TYPES[mode].encode()),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-sds-profiled-status", str(status_code).encode()),
+                    (b"cache-control", b"no-store"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
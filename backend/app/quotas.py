@@ -0,0 +1,110 @@
+import math
+import time
+
+from fastapi import Response
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+
+from app.core.config import settings
+from app.exceptions import SDSAPIRateLimitError
+from app.limiter_storage import BatchedRedisStorage
+from app.metrics import RATE_LIMIT_DECISIONS
+from app.tracing import measure
+from app.utils import get_access_tier
+
+# Quota hits are counted in-process and synced to Redis in batches, like
+# the per-IP limits (see `BatchedRedisStorage`).
+quota_storage = BatchedRedisStorage()
+quota_limiter = FixedWindowRateLimiter(quota_storage)
+
+
+def get_quota_tier(api_key: str) -> str:
+    """
+    Quota tier of an API key: QUOTA_KEY_TIERS maps either the key or its
+    access tier id ("key-" + SHA-256 prefix, so keys need not be written
+    in the config) to a tier of QUOTA_TIERS.
+    """
+    tiers = settings.QUOTA_KEY_TIERS
+    return (
+        tiers.get(api_key)
+        or tiers.get(get_access_tier(api_key))
+        or settings.QUOTA_DEFAULT_TIER
+    )
+
+
+class QuotaAccount:
+    """
+    Cost-weighted quota of one API key for the duration of a request.
+
+    `charge(cost)` counts `cost` units against the key's tier and reports
+    the remaining budget in the X-Quota-* headers of `response`. A charge
+    that does not fit the remaining budget is refused with
+    `SDSAPIRateLimitError` and not counted.
+    """
+
+    def __init__(self, api_key: str, response: Response | None = None):
+        self.identifier = get_access_tier(api_key)
+        self.tier = get_quota_tier(api_key)
+        limit = settings.QUOTA_TIERS.get(
+            self.tier, settings.QUOTA_TIERS.get(settings.QUOTA_DEFAULT_TIER)
+        )
+        self.item = parse(limit) if limit else None
+        self.response = response
+
+    def charge(self, cost: int = 1) -> None:
+        with measure("quota"):
+            self._charge(cost)
+
+    def _charge(self, cost: int) -> None:
+        if self.item is None:
+            self.set_headers()
+            return  # unlimited tier
+        cost = max(1, cost)
+        if not quota_limiter.test(self.item, self.identifier, cost=cost):
+            reset, _ = quota_limiter.get_window_stats(
+                self.item, self.identifier
+            )
+            self.set_headers()
+            RATE_LIMIT_DECISIONS.labels("quota", "rejected").inc()
+            raise SDSAPIRateLimitError(
+                f"API key quota of {self.item.amount} per "
+                f"{self.item.get_expiry()} seconds exceeded "
+                f"(tier {self.tier}, request cost {cost})",
+                retry_after=str(max(1, math.ceil(reset - time.time()))),
+            )
+        quota_limiter.hit(self.item, self.identifier, cost=cost)
+        RATE_LIMIT_DECISIONS.labels("quota", "allowed").inc()
+        self.set_headers()
+
+    def headers(self) -> dict[str, str]:
+        if self.item is None:
+            return {"X-Quota-Tier": self.tier}
+        reset, remaining = quota_limiter.get_window_stats(
+            self.item, self.identifier
+        )
+        return {
+            "X-Quota-Tier": self.tier,
+            "X-Quota-Limit": str(self.item.amount),
+            "X-Quota-Remaining": str(remaining),
+            "X-Quota-Reset": str(math.ceil(reset)),
+        }
+
+    def set_headers(self) -> None:
+        if self.response is not None:
+            self.response.headers.update(self.headers())
+
+
+def get_quota_account(
+    api_key: str, response: Response | None = None
+) -> QuotaAccount | None:
+    """
+    Quota account of a customer API key; None when quotas are disabled or
+    for the demo key, whose anonymous traffic is limited per IP instead.
+    """
+    if not settings.QUOTAS_ENABLED or api_key == settings.SDS_API_KEY:
+        return None
+    return QuotaAccount(api_key, response)
+
+
+async def close_quotas() -> None:
+    await quota_storage.close()
@@ -0,0 +1,152 @@
+import os
+import re
+from typing import BinaryIO
+
+import anyio
+import orjson
+from pydantic import BaseModel
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _model_fields(obj) -> dict:
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+class ModelResponse(Response):
+    """
+    JSON response of pydantic models (or lists of them) that are valid
+    already: orjson renders their fields as they are, without the
+    validation and `jsonable_encoder` pass of a route's response_model.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content, default=_model_fields, option=orjson.OPT_NON_STR_KEYS
+        )
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single-range `Range: bytes=...` header into an inclusive
+    (start, end) pair. Raises ValueError when the range cannot be
+    satisfied; returns None when the header should be ignored (malformed
+    or multiple ranges), in which case the whole file is served.
+    """
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last `end` bytes.
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """
+    Serves an open file, honouring a single-range `Range` request header.
+    The file is closed once the response has been sent.
+
+    The body goes out through the ASGI `http.response.zerocopysend`
+    extension (sendfile) when the server offers it, and is otherwise
+    streamed in chunks read off the event loop.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        range_header: str | None = None,
+        media_type: str | None = None,
+        headers: dict | None = None,
+    ):
+        self.file = file
+        self.range_header = range_header
+        self.media_type = media_type
+        self.status_code = 200
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        with self.file as file:
+            size = os.fstat(file.fileno()).st_size
+            start, end = 0, size - 1
+            self.headers["accept-ranges"] = "bytes"
+            if self.range_header:
+                try:
+                    byte_range = parse_range(self.range_header, size)
+                except ValueError:
+                    self.status_code = 416
+                    self.headers["content-range"] = f"bytes */{size}"
+                    self.headers["content-length"] = "0"
+                    await send(self._start_message())
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                if byte_range is not None:
+                    start, end = byte_range
+                    self.status_code = 206
+                    self.headers[
+                        "content-range"
+                    ] = f"bytes {start}-{end}/{size}"
+            count = end - start + 1
+            self.headers["content-length"] = str(count)
+            await send(self._start_message())
+
+            if scope["method"] == "HEAD" or count <= 0:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file.fileno(),
+                        "offset": start,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+            else:
+                await self._send_chunks(file, start, count, send)
+
+    def _start_message(self) -> dict:
+        return {
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        }
+
+    async def _send_chunks(self, file, start: int, count: int, send: Send):
+        await anyio.to_thread.run_sync(file.seek, start)
+        remaining = count
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(
+                file.read, min(self.chunk_size, remaining)
+            )
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                }
+            )
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})
@@ -12,6 +12,8 @@ from pydantic import ValidationError as PydanticValidationError
 from starlette import status
 
 from app.core.config import settings
+from app.id_codec import get_default_codec
+from app.tracing import measure
 from app.utils import decrypt_to_number, encrypt_number, is_valid_uuid
 
 
@@ -86,6 +88,9 @@ class SDSDetailsSchema(BaseSDSSchema):
 
 class SDSUploadRequestIdSchema(BaseModel):
     id: str
+    # Files of the upload already known by their MD5; only the others
+    # were sent for extraction under `id`.
+    dedup_hits: list[SDSDetailsSchema] | None = None
 
     class Config:
         extra = "forbid"
@@ -145,6 +150,22 @@ class SDSDetailsWithHazardousSchema(SDSDetailsSchema):
             return None
 
 
+def passthrough_details(
+    document: dict, schema: type[SDSDetailsSchema] = SDSDetailsSchema
+) -> dict:
+    """
+    Response document of `schema` for an upstream details document, for
+    DETAILS_PASSTHROUGH: every field is validated by the schema as usual
+    except extracted_data, the bulk of the document, which is passed on
+    as the upstream sent it, to be rendered by `ModelResponse`.
+    """
+    extracted_data = document.get("extracted_data")
+    if not isinstance(extracted_data, dict):
+        return schema(**document).__dict__
+    values = schema(**{**document, "extracted_data": None}).__dict__
+    return {**values, "extracted_data": extracted_data}
+
+
 class NewerSDSInfoSchema(BaseModel):
     sds_id: str
     revision_date: datetime.date | None
@@ -294,18 +315,20 @@ class MultipleSDSDetailsBodySchema(BaseModel):
     @validator("sds_id")
     def validate_sds_id(cls, value):
         if value:
-            if len(value) > settings.VALUE_LIMIT:
+            if len(value) > settings.BULK_MAX_VALUES:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Value limit is {settings.VALUE_LIMIT} SDS IDs",
+                    detail=f"Value limit is {settings.BULK_MAX_VALUES} SDS IDs",
                 )
             try:
+                with measure("decrypt_id"):
+                    ids = get_default_codec().decode_many(value)
                 return [
                     {
-                        "id": decrypt_to_number(v, settings.SECRET_KEY),
+                        "id": id_,
                         "encrypt": f"{v}",
                     }
-                    for v in value
+                    for id_, v in zip(ids, value)
                 ]
             except InvalidToken:
                 raise HTTPException(
@@ -318,10 +341,10 @@ class MultipleSDSDetailsBodySchema(BaseModel):
     @validator("pdf_md5")
     def validate_pdf_md5(cls, value):
         if value:
-            if len(value) > settings.VALUE_LIMIT:
+            if len(value) > settings.BULK_MAX_VALUES:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Value limit is {settings.VALUE_LIMIT} PDF MD5",
+                    detail=f"Value limit is {settings.BULK_MAX_VALUES} PDF MD5",
                 )
             for v in value:
                 if not re.findall(r"^([a-fA-F\d]{32})$", v):
@@ -340,18 +363,20 @@ class MultipleSDSNewRevisionsBodySchema(BaseModel):
     @validator("sds_id")
     def validate_sds_id(cls, value):
         if value:
-            if len(value) > settings.VALUE_LIMIT:
+            if len(value) > settings.BULK_MAX_VALUES:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Value limit is {settings.VALUE_LIMIT} SDS IDs",
+                    detail=f"Value limit is {settings.BULK_MAX_VALUES} SDS IDs",
                 )
             try:
+                with measure("decrypt_id"):
+                    ids = get_default_codec().decode_many(value)
                 return [
                     {
-                        "id": decrypt_to_number(v, settings.SECRET_KEY),
+                        "id": id_,
                         "encrypt": f"{v}",
                     }
-                    for v in value
+                    for id_, v in zip(ids, value)
                 ]
             except InvalidToken:
                 raise HTTPException(
@@ -364,10 +389,10 @@ class MultipleSDSNewRevisionsBodySchema(BaseModel):
     @validator("pdf_md5")
     def validate_pdf_md5(cls, value):
         if value:
-            if len(value) > settings.VALUE_LIMIT:
+            if len(value) > settings.BULK_MAX_VALUES:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Value limit is {settings.VALUE_LIMIT} PDF MD5",
+                    detail=f"Value limit is {settings.BULK_MAX_VALUES} PDF MD5",
                 )
             for v in value:
                 if not re.findall(r"^([a-fA-F\d]{32})$", v):
@@ -378,6 +403,19 @@ class MultipleSDSNewRevisionsBodySchema(BaseModel):
 
         return value
 
+
+class BulkItemErrorSchema(BaseModel):
+    # Stands in for every item of a bulk request chunk that failed
+    # upstream, so the other chunks can still be returned.
+    sds_id: str | None
+    pdf_md5: str | None
+    error_code: int
+    error_message: str
+
+    class Config:
+        extra = "forbid"
+
+
 class SDSExtractionStatusSchema(BaseModel):
     request_id: str | None = None
     progress: int | None = None
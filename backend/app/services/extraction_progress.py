@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+from app import schemas
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Steps after which the upstream extraction status no longer changes
+# (mirrors TERMINAL_STEPS in the frontend).
+TERMINAL_STEPS = {
+    "SUCCESS",
+    "FAILED",
+    "CAN_NOT_SPLIT_FILE",
+    "PDF_IS_NOT_SDS",
+    "OCR_FAILED",
+    "SDS_EXIST",
+}
+
+_CLOSED = object()
+
+
+class ExtractionStreamInterrupted(Exception):
+    """
+    Raised by a status stream that stops before the extraction reached a
+    terminal step. `reason` is "timeout" once EXTRACTION_STREAM_MAX_DURATION
+    has passed, or "status_unavailable" when polling the upstream failed.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+StatusFetcher = Callable[[], Awaitable[schemas.SDSExtractionStatusSchema]]
+
+
+def current_progress(status: schemas.SDSExtractionStatusSchema):
+    """
+    (progress, step) of an extraction: those of the first file when the
+    status has per-file info, as the frontend reads them.
+    """
+    progress, step = status.progress, status.step
+    if status.file_info:
+        first = next(iter(status.file_info.values()), None)
+        if isinstance(first, dict):
+            progress = first.get("progress", progress)
+            step = first.get("step", step)
+    return progress or 0, step or ""
+
+
+def is_finished(status: schemas.SDSExtractionStatusSchema) -> bool:
+    progress, step = current_progress(status)
+    return bool(status.error_code) or progress >= 100 or step in TERMINAL_STEPS
+
+
+class ExtractionStatusPoller:
+    """
+    Polls the upstream status of one extraction and fans every change out
+    to the subscribed streams.
+
+    The interval starts at EXTRACTION_POLL_MIN_INTERVAL and grows by half
+    after each poll that brought no change, up to
+    EXTRACTION_POLL_MAX_INTERVAL; a change (or progress past 90%) resets
+    it. Polling stops when the extraction finishes, fails, or the last
+    subscriber leaves.
+    """
+
+    def __init__(self, request_id: str, fetch: StatusFetcher):
+        self.request_id = request_id
+        self._fetch = fetch
+        self.latest: str | None = None
+        self.finished = False
+        # Why polling stopped short of a terminal step, if it did.
+        self.error: str | None = None
+        self.polls = 0
+        self.subscribers: set[asyncio.Queue] = set()
+        self.task: asyncio.Task | None = None
+
+    async def fetch(self) -> schemas.SDSExtractionStatusSchema:
+        self.polls += 1
+        return await self._fetch()
+
+    def publish(self, status: schemas.SDSExtractionStatusSchema) -> bool:
+        data = status.json()
+        changed = data != self.latest
+        if changed:
+            self.latest = data
+            for queue in self.subscribers:
+                queue.put_nowait(data)
+        return changed
+
+    def close(self) -> None:
+        self.finished = True
+        for queue in self.subscribers:
+            queue.put_nowait(_CLOSED)
+
+    async def run(self, first: schemas.SDSExtractionStatusSchema) -> None:
+        status = first
+        interval = settings.EXTRACTION_POLL_MIN_INTERVAL
+        deadline = time.monotonic() + settings.EXTRACTION_STREAM_MAX_DURATION
+        try:
+            while not is_finished(status):
+                if time.monotonic() >= deadline:
+                    self.error = "timeout"
+                    break
+                await asyncio.sleep(interval)
+                if not self.subscribers:
+                    break
+                status = await self.fetch()
+                progress, _ = current_progress(status)
+                if self.publish(status) or progress >= 90:
+                    interval = settings.EXTRACTION_POLL_MIN_INTERVAL
+                else:
+                    interval = min(
+                        interval * 1.5, settings.EXTRACTION_POLL_MAX_INTERVAL
+                    )
+        except Exception as e:
+            logger.warning(
+                "Extraction status polling of %s failed: %s",
+                self.request_id,
+                e,
+            )
+            self.error = "status_unavailable"
+        finally:
+            self.close()
+
+
+class ExtractionStatusBroadcaster:
+    """
+    Runs at most one `ExtractionStatusPoller` per key in this worker,
+    however many streams follow that extraction. Callers key pollers on
+    everything that can change the upstream answer (access tier,
+    request_id, email).
+    """
+
+    def __init__(self):
+        self._pollers: dict[tuple, ExtractionStatusPoller] = {}
+        self._starting: dict[tuple, asyncio.Future] = {}
+
+    async def _get_poller(
+        self, key: tuple, request_id: str, fetch: StatusFetcher
+    ) -> ExtractionStatusPoller:
+        poller = self._pollers.get(key)
+        if poller is not None and not poller.finished:
+            return poller
+        starting = self._starting.get(key)
+        if starting is None:
+            starting = asyncio.create_task(self._start(key, request_id, fetch))
+            self._starting[key] = starting
+            starting.add_done_callback(lambda _: self._started(key))
+        # The first poll is awaited by the subscribing requests, so upstream
+        # errors (bad key, unknown request id) surface as HTTP errors; it is
+        # shielded so that one client going away does not fail the others.
+        return await asyncio.shield(starting)
+
+    async def _start(
+        self, key: tuple, request_id: str, fetch: StatusFetcher
+    ) -> ExtractionStatusPoller:
+        poller = ExtractionStatusPoller(request_id, fetch)
+        first = await poller.fetch()
+        poller.publish(first)
+        self._pollers[key] = poller
+        poller.task = asyncio.create_task(poller.run(first))
+        poller.task.add_done_callback(lambda _: self._forget(key, poller))
+        return poller
+
+    def _started(self, key: tuple) -> None:
+        task = self._starting.pop(key)
+        if not task.cancelled():
+            # Retrieve the error even when every subscriber has left.
+            task.exception()
+
+    def _forget(self, key: tuple, poller: ExtractionStatusPoller) -> None:
+        if self._pollers.get(key) is poller:
+            del self._pollers[key]
+
+    async def subscribe(
+        self, key: tuple, request_id: str, fetch: StatusFetcher
+    ) -> AsyncIterator[str | None]:
+        """
+        Returns an iterator over the status documents (JSON) of an
+        extraction, starting with the current one. Raises the SDS API
+        errors of the first poll.
+        """
+        poller = await self._get_poller(key, request_id, fetch)
+        queue: asyncio.Queue = asyncio.Queue()
+        queue.put_nowait(poller.latest)
+        if poller.finished:
+            queue.put_nowait(_CLOSED)
+        else:
+            poller.subscribers.add(queue)
+        return self._iterate(poller, queue)
+
+    async def _iterate(
+        self, poller: ExtractionStatusPoller, queue: asyncio.Queue
+    ) -> AsyncIterator[str | None]:
+        """
+        Yields status documents, and None after EXTRACTION_STREAM_KEEPALIVE
+        seconds without one so the stream can send a keep-alive. Raises
+        `ExtractionStreamInterrupted` if polling stopped before the
+        extraction finished.
+        """
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        queue.get(), settings.EXTRACTION_STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if data is _CLOSED:
+                    if poller.error:
+                        raise ExtractionStreamInterrupted(poller.error)
+                    return
+                yield data
+        finally:
+            poller.subscribers.discard(queue)
+            if not poller.subscribers and poller.task:
+                poller.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "pollers": len(self._pollers),
+            "subscribers": sum(
+                len(p.subscribers) for p in self._pollers.values()
+            ),
+        }
+
+
+extraction_status_broadcaster = ExtractionStatusBroadcaster()
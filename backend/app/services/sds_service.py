@@ -1,13 +1,74 @@
+import asyncio
+import functools
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable
+
 from fastapi import UploadFile
+from starlette import status
+from starlette.concurrency import run_in_threadpool
 
 from app import schemas
-from app.clients.sds_api_client import SDSAPIClient
+from app.clients.sds_api_client import SDSAPIClient, iter_response_bytes
 from app.core.config import settings
+from app.exceptions import (
+    SDSAPIInternalError,
+    SDSAPIRateLimitError,
+    SDSAPIRequestNotAuthorized,
+    SDSAPIUnavailableError,
+    SDSBadRequestException,
+    SDSNotFoundError,
+    SDSNotFoundException,
+)
+from app.pdf_cache import safety_summary_cache
+from app.quotas import QuotaAccount
+from app.services.extraction_progress import extraction_status_broadcaster
+from app.tracing import span
+from app.utils import upload_file_md5
+
+# Upstream failures of one bulk chunk, reported per item as
+# (error_code, default error_message).
+BULK_CHUNK_ERRORS = {
+    SDSBadRequestException: (status.HTTP_400_BAD_REQUEST, "Bad request"),
+    SDSAPIRequestNotAuthorized: (
+        status.HTTP_401_UNAUTHORIZED,
+        "Invalid API key",
+    ),
+    SDSNotFoundException: (status.HTTP_404_NOT_FOUND, "SDS not found"),
+    SDSNotFoundError: (status.HTTP_404_NOT_FOUND, "Not found"),
+    SDSAPIRateLimitError: (
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        "Rate limit exceeded",
+    ),
+    SDSAPIInternalError: (
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+        "SDS API request failed",
+    ),
+    SDSAPIUnavailableError: (
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        "SDS API is temporarily unavailable",
+    ),
+}
+
+
+def chunked(values: list | None, size: int) -> list[list]:
+    if not values:
+        return []
+    return [values[i : i + size] for i in range(0, len(values), size)]
 
 
 class SDSService:
-    def __init__(self, sds_api_key: str):
+    def __init__(self, sds_api_key: str, quota: QuotaAccount | None = None):
         self.sds_api_client = SDSAPIClient(api_key=sds_api_key)
+        self.quota = quota
+
+    def _charge(self, cost: int = 1) -> None:
+        if self.quota is not None:
+            self.quota.charge(cost)
+
+    def quota_headers(self) -> dict[str, str]:
+        """
+        X-Quota-* headers, for endpoints that build their own Response.
+        """
+        return self.quota.headers() if self.quota is not None else {}
 
     async def search_sds(
         self,
@@ -16,6 +77,7 @@ class SDSService:
         page_size: int,
         fe: bool,
     ) -> list[schemas.ListSDSSchema]:
+        self._charge()
         api_response = await self.sds_api_client.search_sds(
             search=search.search,
             search_type=search.search_type,
@@ -29,11 +91,13 @@ class SDSService:
             page_size=page_size,
             fe=fe,
         )
-        return [schemas.ListSDSSchema(**el) for el in api_response]
+        with span("models"):
+            return [schemas.ListSDSSchema(**el) for el in api_response]
 
     async def get_sds_details(
         self, search: schemas.SDSDetailsBodySchema, fe: bool
-    ) -> schemas.SDSDetailsWithHazardousSchema:
+    ) -> schemas.SDSDetailsWithHazardousSchema | dict:
+        self._charge()
         api_response = await self.sds_api_client.get_sds_details(
             sds_id=search.sds_id,
             language_code=search.language_code,
@@ -48,11 +112,17 @@ class SDSService:
         # local to the gateway as well.
         if fe or self.sds_api_client.api_key == settings.SDS_API_KEY:
             api_response.pop("hazardous", None)
-        return schemas.SDSDetailsWithHazardousSchema(**api_response)
+        with span("models"):
+            if settings.DETAILS_PASSTHROUGH:
+                return schemas.passthrough_details(
+                    api_response, schemas.SDSDetailsWithHazardousSchema
+                )
+            return schemas.SDSDetailsWithHazardousSchema(**api_response)
 
     async def get_dif_language_versions(
         self, search: schemas.SDSDifLanguageVersionsBodySchema, fe: bool
     ) -> list[schemas.ListSDSSchema]:
+        self._charge()
         api_response = await self.sds_api_client.get_dif_language_versions(
             sds_id=search.sds_id,
             pdf_md5=search.pdf_md5,
@@ -60,21 +130,105 @@ class SDSService:
             is_current_version=search.is_current_version,
             fe=fe,
         )
-        return [schemas.ListSDSSchema(**el) for el in api_response if isinstance(el, dict)]
+        with span("models"):
+            return [schemas.ListSDSSchema(**el) for el in api_response if isinstance(el, dict)]
+
+    async def _fan_out(
+        self,
+        fetch: Callable[..., Awaitable[list]],
+        sds_id: list[dict] | None,
+        pdf_md5: list[str] | None,
+        fe: bool,
+    ) -> list:
+        """
+        Calls a bulk upstream endpoint, splitting ids beyond
+        settings.VALUE_LIMIT into chunks that are fetched concurrently
+        (up to settings.BULK_CHUNK_CONCURRENCY at a time).
+
+        Results are concatenated in input order. A failed chunk yields one
+        BulkItemErrorSchema per item; only if every chunk fails is the
+        error raised as for a single request.
+        """
+        limit = settings.VALUE_LIMIT
+        if len(sds_id or []) <= limit and len(pdf_md5 or []) <= limit:
+            return await fetch(sds_id=sds_id, pdf_md5=pdf_md5, fe=fe)
+
+        chunks = [{"sds_id": chunk} for chunk in chunked(sds_id, limit)]
+        chunks += [{"pdf_md5": chunk} for chunk in chunked(pdf_md5, limit)]
+        semaphore = asyncio.Semaphore(settings.BULK_CHUNK_CONCURRENCY)
+
+        async def fetch_chunk(chunk: dict):
+            async with semaphore:
+                try:
+                    return await fetch(**chunk, fe=fe)
+                except tuple(BULK_CHUNK_ERRORS) as ex:
+                    return ex
+
+        results = await asyncio.gather(*map(fetch_chunk, chunks))
+        errors = [r for r in results if isinstance(r, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+
+        merged = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                merged.extend(self._bulk_item_errors(chunk, result))
+            else:
+                merged.extend(result)
+        return merged
+
+    @staticmethod
+    def _bulk_cost(sds_id: list | None, pdf_md5: list | None) -> int:
+        # Both lists are fetched when both are sent (see `_fan_out`).
+        items = len(sds_id or []) + len(pdf_md5 or [])
+        return settings.QUOTA_COST_BULK_ITEM * items
+
+    @staticmethod
+    def _bulk_item_errors(
+        chunk: dict, ex: Exception
+    ) -> list[schemas.BulkItemErrorSchema]:
+        error_code, error_message = BULK_CHUNK_ERRORS[type(ex)]
+        if ex.args and ex.args[0]:
+            error_message = str(ex.args[0])
+        return [
+            schemas.BulkItemErrorSchema(
+                sds_id=item["encrypt"] if "sds_id" in chunk else None,
+                pdf_md5=item if "pdf_md5" in chunk else None,
+                error_code=error_code,
+                error_message=error_message,
+            )
+            for item in chunk.get("sds_id") or chunk["pdf_md5"]
+        ]
 
     async def get_multiple_sds_details(
         self, search: schemas.MultipleSDSDetailsBodySchema, fe: bool
-    ) -> list[schemas.SDSDetailsSchema]:
-        api_response = await self.sds_api_client.get_multiple_sds_details(
+    ) -> list[schemas.SDSDetailsSchema | schemas.BulkItemErrorSchema | dict]:
+        self._charge(self._bulk_cost(search.sds_id, search.pdf_md5))
+        api_response = await self._fan_out(
+            self.sds_api_client.get_multiple_sds_details,
             sds_id=search.sds_id,
             pdf_md5=search.pdf_md5,
             fe=fe,
         )
-        return [schemas.SDSDetailsSchema(**el) for el in api_response]
+        with span("models"):
+            if settings.DETAILS_PASSTHROUGH:
+                return [
+                    el
+                    if isinstance(el, schemas.BulkItemErrorSchema)
+                    else schemas.passthrough_details(el)
+                    for el in api_response
+                ]
+            return [
+                el
+                if isinstance(el, schemas.BulkItemErrorSchema)
+                else schemas.SDSDetailsSchema(**el)
+                for el in api_response
+            ]
 
     async def get_newer_sds_info(
         self, search: schemas.SDSDetailsBodySchema, fe: bool
     ) -> schemas.NewRevisionInfoSchema:
+        self._charge()
         api_response = await self.sds_api_client.get_new_revision_sds_info(
             sds_id=search.sds_id,
             pdf_md5=search.pdf_md5,
@@ -84,17 +238,23 @@ class SDSService:
 
     async def get_multiple_newer_sds_info(
         self, search: schemas.MultipleSDSNewRevisionsBodySchema, fe: bool
-    ) -> list[schemas.MultipleNewRevisionInfoSchema]:
-        api_response = (
-            await self.sds_api_client.get_multiple_new_revision_sds_info(
-                sds_id=search.sds_id,
-                pdf_md5=search.pdf_md5,
-                fe=fe,
-            )
+    ) -> list[
+        schemas.MultipleNewRevisionInfoSchema | schemas.BulkItemErrorSchema
+    ]:
+        self._charge(self._bulk_cost(search.sds_id, search.pdf_md5))
+        api_response = await self._fan_out(
+            self.sds_api_client.get_multiple_new_revision_sds_info,
+            sds_id=search.sds_id,
+            pdf_md5=search.pdf_md5,
+            fe=fe,
         )
-        return [
-            schemas.MultipleNewRevisionInfoSchema(**el) for el in api_response
-        ]
+        with span("models"):
+            return [
+                el
+                if isinstance(el, schemas.BulkItemErrorSchema)
+                else schemas.MultipleNewRevisionInfoSchema(**el)
+                for el in api_response
+            ]
 
     async def upload_sds(
         self,
@@ -105,6 +265,75 @@ class SDSService:
         product_code: str,
         private_import: bool,
         email: str | None = None,
+        dedup_details: bool = False,
+    ) -> tuple[
+        schemas.SDSUploadRequestIdSchema
+        | schemas.SDSDetailsSchema
+        | list[schemas.SDSDetailsSchema],
+        list[str],
+    ]:
+        """
+        Returns the upload result and the MD5s of the files that were
+        already known upstream (dedup hits) and so not sent for extraction.
+
+        Dedup is skipped for the demo frontend (fe), which tracks every
+        upload by request id, and for uploads carrying import options,
+        whose side effects only the extraction pipeline applies.
+
+        An upload of several files answers with a request id, which the
+        upstream only gives for two files or more: with fewer new files,
+        every file is sent as without dedup, unless the caller opted in
+        to a list of details (`dedup_details`).
+        """
+        self._charge(len(files) * settings.QUOTA_COST_UPLOAD_FILE)
+        known = {}
+        if (
+            settings.UPLOAD_DEDUP_ENABLED
+            and not fe
+            and not private_import
+            and not (sku or upc_ean or product_code or email)
+        ):
+            md5s = [await upload_file_md5(f) for f in files]
+            known = await self._find_known_sds(md5s)
+        if not known:
+            uploaded = await self._upload_new_sds(
+                files, fe, sku, upc_ean, product_code, private_import, email
+            )
+            return uploaded, []
+
+        new_files = [f for f, md5 in zip(files, md5s) if md5 not in known]
+        dedup_hits = [md5 for md5 in md5s if md5 in known]
+        if len(files) > 1 and len(new_files) < 2 and not dedup_details:
+            uploaded = await self._upload_new_sds(
+                files, fe, sku, upc_ean, product_code, private_import, email
+            )
+            return uploaded, []
+        if not new_files:
+            if len(files) == 1:
+                return known[md5s[0]], dedup_hits
+            return [known[md5] for md5 in md5s], dedup_hits
+
+        uploaded = await self._upload_new_sds(
+            new_files, fe, sku, upc_ean, product_code, private_import, email
+        )
+        if isinstance(uploaded, schemas.SDSUploadRequestIdSchema):
+            uploaded.dedup_hits = [known[md5] for md5 in dedup_hits]
+            return uploaded, dedup_hits
+        # A single new file (dedup_details) is extracted synchronously:
+        # answer with every file's details in upload order.
+        return [
+            known[md5] if md5 in known else uploaded for md5 in md5s
+        ], dedup_hits
+
+    async def _upload_new_sds(
+        self,
+        files: list[UploadFile],
+        fe: bool,
+        sku: str,
+        upc_ean: str,
+        product_code: str,
+        private_import: bool,
+        email: str | None,
     ) -> schemas.SDSUploadRequestIdSchema | schemas.SDSDetailsSchema:
         api_response = await self.sds_api_client.upload_sds(
             files=files,
@@ -119,21 +348,91 @@ class SDSService:
             return schemas.SDSUploadRequestIdSchema(id=api_response["id"])
         return schemas.SDSDetailsSchema(**api_response)
 
+    async def _find_known_sds(
+        self, md5s: list[str]
+    ) -> dict[str, schemas.SDSDetailsSchema]:
+        """
+        Looks the uploaded files up by PDF MD5. Best effort: any upstream
+        failure just means every file gets extracted.
+        """
+        unique_md5s = list(dict.fromkeys(md5s))
+        try:
+            api_response = await self._fan_out(
+                self.sds_api_client.get_multiple_sds_details,
+                sds_id=None,
+                pdf_md5=unique_md5s,
+                fe=False,
+            )
+        except tuple(BULK_CHUNK_ERRORS):
+            return {}
+        known = {}
+        for el in api_response:
+            if isinstance(el, dict) and el.get("pdf_md5"):
+                known.setdefault(
+                    el["pdf_md5"].lower(), schemas.SDSDetailsSchema(**el)
+                )
+        return known
+
     async def get_extraction_status(
         self, request_id: str, email: str | None, fe: bool
+    ) -> schemas.SDSExtractionStatusSchema:
+        self._charge()
+        return await self._fetch_extraction_status(request_id, email, fe)
+
+    async def _fetch_extraction_status(
+        self, request_id: str, email: str | None, fe: bool
     ) -> schemas.SDSExtractionStatusSchema:
         api_response = await self.sds_api_client.get_extraction_status(
             request_id=request_id, email=email, fe=fe
         )
         return schemas.SDSExtractionStatusSchema(**api_response)
 
+    async def stream_extraction_status(
+        self, request_id: str, email: str | None, fe: bool
+    ) -> AsyncIterator[str | None]:
+        """
+        Status documents (JSON) of an extraction as they change, sharing
+        one upstream poller with every other stream of the same request.
+        None marks a quiet period the caller may fill with a keep-alive.
+        The stream is charged as one request, whatever its polls.
+        """
+        self._charge()
+        return await extraction_status_broadcaster.subscribe(
+            key=(self.sds_api_client.access_tier, request_id, email),
+            request_id=request_id,
+            fetch=functools.partial(
+                self._fetch_extraction_status,
+                request_id=request_id,
+                email=email,
+                fe=fe,
+            ),
+        )
+
     async def get_sds_safety_information_summary(
         self, search: schemas.SDSSafetyInformationSummaryBodySchema, fe: bool
-    ) -> bytes:
-        api_response = await self.sds_api_client.get_sds_safety_information_summary(
+    ) -> BinaryIO | AsyncIterator[bytes]:
+        """
+        Returns the cached PDF opened for reading, or else the PDF streamed from
+        the upstream (and stored in the cache as it goes).
+        """
+        self._charge(settings.QUOTA_COST_SAFETY_SUMMARY)
+        cache_key = (
+            self.sds_api_client.access_tier,
+            search.sds_id.get("id") if search.sds_id else None,
+            search.pdf_md5,
+            search.section_display,
+        )
+        cached = await run_in_threadpool(
+            safety_summary_cache.lookup, cache_key
+        )
+        if cached is not None:
+            return cached
+        response = await self.sds_api_client.stream_sds_safety_information_summary(
             sds_id=search.sds_id,
             pdf_md5=search.pdf_md5,
             section_display=search.section_display,
             fe=fe
         )
-        return bytes(api_response)
\ No newline at end of file
+        return safety_summary_cache.write_through(
+            cache_key, iter_response_bytes(response)
+        )
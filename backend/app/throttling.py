@@ -1,9 +1,11 @@
 from typing import Any, Callable, Optional
-from urllib.parse import quote
 from fastapi import Request
 from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 from app.core.config import settings
+from app.limiter_storage import BatchedRedisStorage
+from app.metrics import RATE_LIMIT_DECISIONS
 
 class CustomLimiter(Limiter):
     def _check_request_limit(
@@ -15,9 +17,14 @@ class CustomLimiter(Limiter):
         if request.headers.get("X-SDS-SEARCH-ACCESS-API-KEY"):
             request.state.view_rate_limit = 1
             return
-        return super()._check_request_limit(
-            request, endpoint_func, in_middleware
-        )
+        try:
+            super()._check_request_limit(
+                request, endpoint_func, in_middleware
+            )
+        except RateLimitExceeded:
+            RATE_LIMIT_DECISIONS.labels("ip", "rejected").inc()
+            raise
+        RATE_LIMIT_DECISIONS.labels("ip", "allowed").inc()
 
 def get_real_ip(request: Request) -> str:
     real_ip = request.headers.get("x-real-ip", request.headers.get("x-remote_addr"))
@@ -25,12 +32,14 @@ def get_real_ip(request: Request) -> str:
     return real_ip
 
 
-if settings.REDIS_HOST and settings.REDIS_PORT and settings.REDIS_DB:
-    redis_url = (
-        f"redis://:{quote(settings.REDIS_PASSWORD, '')}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
-        if settings.REDIS_PASSWORD
-        else f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
-    )
-    limiter = CustomLimiter(key_func=get_real_ip, storage_uri=redis_url)
+if settings.RATE_LIMIT_BATCHED:
+    limiter = CustomLimiter(key_func=get_real_ip, storage_uri="batched://")
+elif settings.redis_url:
+    limiter = CustomLimiter(key_func=get_real_ip, storage_uri=settings.redis_url)
 else:
     limiter = CustomLimiter(key_func=get_real_ip)
+
+
+async def close_limiter() -> None:
+    if isinstance(limiter._storage, BatchedRedisStorage):
+        await limiter._storage.close()
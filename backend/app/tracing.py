@@ -0,0 +1,482 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import secrets
+import time
+from contextvars import ContextVar
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# A trace keeps at most this many spans; later ones are dropped (and
+# counted), e.g. the polls of a long extraction status stream.
+MAX_SPANS = 512
+# Seconds between exports to the collector, most traces waiting for
+# export (later ones are dropped) and timeout of an export request.
+EXPORT_INTERVAL = 5
+EXPORT_MAX_QUEUE = 1024
+EXPORT_TIMEOUT = 2
+
+API_KEY_HEADER = b"x-sds-search-access-api-key"
+# W3C trace context of the caller: version-trace id-parent id-flags.
+TRACEPARENT_RE = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+# OTLP span kinds.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+_trace: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+_parent_span_id: ContextVar[str | None] = ContextVar(
+    "parent_span_id", default=None
+)
+
+
+def _new_span_id() -> str:
+    return secrets.token_hex(8)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attributes = attributes
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+
+class Trace:
+    """
+    Spans of one request, from `TracingMiddleware` to the last byte of
+    the response. Besides spans, it sums up `measure()`d code that runs
+    too often to get a span per call (id encryption, quota checks).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str | None = None,
+        remote_parent_id: str | None = None,
+        server_timing: bool = False,
+        export: bool = False,
+    ):
+        self.name = name
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.remote_parent_id = remote_parent_id
+        self.span_id = _new_span_id()
+        self.server_timing = server_timing
+        self.export = export
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.end: float | None = None
+        self.attributes: dict = {}
+        self.spans: list[Span] = []
+        self.dropped_spans = 0
+        # Name -> [seconds, calls].
+        self.measures: dict[str, list] = {}
+
+    def add_span(self, span: Span) -> bool:
+        if self.end is not None or len(self.spans) >= MAX_SPANS:
+            self.dropped_spans += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    def record_span(
+        self, name: str, start: float, end: float, **attributes
+    ) -> None:
+        """
+        Adds a span that has already ended, as a child of the current one.
+        """
+        span = Span(name, _parent_span_id.get() or self.span_id, attributes)
+        span.start = start
+        span.end = end
+        self.add_span(span)
+
+    def add_measure(self, name: str, seconds: float) -> None:
+        measure = self.measures.get(name)
+        if measure is None:
+            self.measures[name] = [seconds, 1]
+        else:
+            measure[0] += seconds
+            measure[1] += 1
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def durations(self, now: float | None = None) -> dict[str, float]:
+        """
+        Wall-clock seconds covered by the spans of each name, in order of
+        their first start. Overlapping spans (the concurrent chunks of a
+        bulk request, a hedged upstream call) are counted once.
+        """
+        now = time.perf_counter() if now is None else now
+        intervals: dict[str, list] = {}
+        for span in self.spans:
+            intervals.setdefault(span.name, []).append(
+                (span.start, span.end if span.end is not None else now)
+            )
+        durations = {}
+        for name, spans in intervals.items():
+            total = 0.0
+            covered_until = float("-inf")
+            for start, end in sorted(spans):
+                start = max(start, covered_until)
+                if end > start:
+                    total += end - start
+                    covered_until = end
+            durations[name] = total
+        return durations
+
+    def server_timing_header(self) -> str:
+        now = time.perf_counter()
+        metrics = [
+            f"{name};dur={seconds * 1000:.1f}"
+            for name, seconds in self.durations(now).items()
+        ]
+        metrics += [
+            f'{name};dur={seconds * 1000:.1f};desc="calls={calls}"'
+            for name, (seconds, calls) in self.measures.items()
+        ]
+        metrics.append(f"total;dur={(now - self.start) * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def _unix_nano(self, perf_time: float) -> str:
+        return str(self.start_ns + int((perf_time - self.start) * 1e9))
+
+    def to_otlp(self) -> list[dict]:
+        """
+        The trace as OTLP spans (JSON encoding): the request span and its
+        descendants.
+        """
+        end = self.end if self.end is not None else time.perf_counter()
+        attributes = dict(self.attributes)
+        for name, (seconds, calls) in self.measures.items():
+            attributes[f"sds.{name}.duration_ms"] = round(seconds * 1000, 3)
+            attributes[f"sds.{name}.calls"] = calls
+        if self.dropped_spans:
+            attributes["sds.dropped_spans"] = self.dropped_spans
+        failed = attributes.get("http.status_code", 500) >= 500
+        spans = [
+            {
+                "traceId": self.trace_id,
+                "spanId": self.span_id,
+                "parentSpanId": self.remote_parent_id or "",
+                "name": self.name,
+                "kind": SPAN_KIND_SERVER,
+                "startTimeUnixNano": self._unix_nano(self.start),
+                "endTimeUnixNano": self._unix_nano(end),
+                "attributes": _otlp_attributes(attributes),
+                "status": {"code": 2 if failed else 1},
+            }
+        ]
+        for span in self.spans:
+            spans.append(
+                {
+                    "traceId": self.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id,
+                    "name": span.name,
+                    "kind": SPAN_KIND_INTERNAL,
+                    "startTimeUnixNano": self._unix_nano(span.start),
+                    "endTimeUnixNano": self._unix_nano(
+                        span.end if span.end is not None else end
+                    ),
+                    "attributes": _otlp_attributes(span.attributes),
+                    "status": {"code": 2 if "error" in span.attributes else 0},
+                }
+            )
+        return spans
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            value = {"boolValue": value}
+        elif isinstance(value, int):
+            value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            value = {"doubleValue": value}
+        else:
+            value = {"stringValue": str(value)}
+        result.append({"key": key, "value": value})
+    return result
+
+
+class _SpanContext:
+    __slots__ = ("trace", "span", "token")
+
+    def __init__(self, trace: Trace, name: str, attributes: dict):
+        self.trace = trace
+        self.span = Span(
+            name, _parent_span_id.get() or trace.span_id, attributes
+        )
+        self.token = None
+
+    def __enter__(self) -> Span:
+        if self.trace.add_span(self.span):
+            self.token = _parent_span_id.set(self.span.span_id)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        if self.token is not None:
+            _parent_span_id.reset(self.token)
+
+
+class _MeasureContext:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.add_measure(self.name, time.perf_counter() - self.start)
+
+
+class _NoSpan:
+    """
+    Stands for spans and measures of requests that are not traced.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Context manager timing a block of the current request as a span,
+    a child of the enclosing span. A no-op outside traced requests.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _SpanContext(trace, name, attributes)
+
+
+def measure(name: str):
+    """
+    Context manager adding the time of a block to the `name` total of the
+    current request, for code too hot for a span per call.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _MeasureContext(trace, name)
+
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+
+class OTLPExporter:
+    """
+    Sends finished traces to an OpenTelemetry collector with OTLP/HTTP
+    (JSON encoding), batched every EXPORT_INTERVAL seconds by a background
+    task. Traces beyond EXPORT_MAX_QUEUE waiting ones, and batches the
+    collector fails to take, are dropped.
+    """
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._queue: list[Trace] = []
+        self._task: asyncio.Task | None = None
+        self._client: httpx.AsyncClient | None = None
+        self.exported = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def submit(self, trace: Trace) -> None:
+        if len(self._queue) >= EXPORT_MAX_QUEUE:
+            self.dropped += 1
+            return
+        self._queue.append(trace)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(
+                self._export_loop()
+            )
+
+    async def _export_loop(self) -> None:
+        while self._queue:
+            await asyncio.sleep(EXPORT_INTERVAL)
+            await self.export()
+
+    async def export(self) -> None:
+        if not self._queue:
+            return
+        traces, self._queue = self._queue, []
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes(
+                            {
+                                "service.name": self.service_name,
+                                "process.pid": os.getpid(),
+                            }
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [
+                                span
+                                for trace in traces
+                                for span in trace.to_otlp()
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=EXPORT_TIMEOUT)
+        try:
+            response = await self._client.post(self.endpoint, json=body)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.failures += 1
+            self.dropped += len(traces)
+            logger.warning("Trace export to %s failed: %r", self.endpoint, e)
+            return
+        self.exported += len(traces)
+
+    async def close(self) -> None:
+        """
+        Stops the export task after sending the traces still queued.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.export()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+exporter = (
+    OTLPExporter(settings.TRACING_OTLP_ENDPOINT, settings.TRACING_SERVICE_NAME)
+    if settings.TRACING_OTLP_ENDPOINT
+    else None
+)
+
+
+def start_trace(scope) -> Trace | None:
+    """
+    Trace of a request, if it is to be traced: requests made with one of
+    ADMIN_API_KEYS or TRACING_API_KEYS (which also get the Server-Timing
+    header) and, when exporting, the TRACING_SAMPLE_RATE share of the
+    others plus those the caller's traceparent marks as sampled.
+    """
+    api_key = traceparent = None
+    for name, value in scope["headers"]:
+        if name == API_KEY_HEADER:
+            api_key = value.decode("latin-1")
+        elif name == b"traceparent":
+            traceparent = TRACEPARENT_RE.fullmatch(value.decode("latin-1"))
+    server_timing = bool(api_key) and (
+        api_key in settings.ADMIN_API_KEYS
+        or api_key in settings.TRACING_API_KEYS
+    )
+    export = exporter is not None and (
+        server_timing
+        or (traceparent is not None and int(traceparent[3], 16) & 1)
+        or random.random() < settings.TRACING_SAMPLE_RATE
+    )
+    if not (server_timing or export):
+        return None
+    trace = Trace(
+        f"{scope['method']} {scope['path']}",
+        trace_id=traceparent[1] if traceparent else None,
+        remote_parent_id=traceparent[2] if traceparent else None,
+        server_timing=server_timing,
+        export=export,
+    )
+    trace.attributes["http.method"] = scope["method"]
+    trace.attributes["http.target"] = scope["path"]
+    return trace
+
+
+class TracingMiddleware:
+    """
+    Traces the requests picked by `start_trace`: adds the Server-Timing
+    header to the response and hands the finished trace to the exporter.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = start_trace(scope)
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.attributes["http.status_code"] = message["status"]
+                if trace.server_timing:
+                    message = {
+                        **message,
+                        "headers": [
+                            *message.get("headers", []),
+                            (
+                                b"server-timing",
+                                trace.server_timing_header().encode(),
+                            ),
+                        ],
+                    }
+            await send(message)
+
+        token = _trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            trace.finish()
+            if trace.export:
+                exporter.submit(trace)
+
+
+async def close_tracing() -> None:
+    if exporter is not None:
+        await exporter.close()
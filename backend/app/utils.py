@@ -1,15 +1,22 @@
+import hashlib
+import os
+from typing import BinaryIO
 from uuid import UUID
-from cryptography.fernet import Fernet
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from cryptography.fernet import InvalidToken
 from app.core.config import settings
-from app.exceptions.sds_api import SDSAPIInternalError
+from app.exceptions.sds_api import SDSAPIInternalError, SDSBadRequestException
+from app.id_codec import get_codec
+from app.tracing import measure
 
 
 # Encrypt number to a secret string
 def encrypt_number(number, key):
     try:
-        cipher_suite = Fernet(key)
-        encrypted_number = cipher_suite.encrypt(str(number).encode())
-        return encrypted_number
+        with measure("encrypt_id"):
+            return get_codec(key).encode(number)
     except Exception as e:
         print(f"Error encrypting number: {e}")
         raise SDSAPIInternalError(f"Encryption failed: {e}")
@@ -18,27 +25,37 @@ def encrypt_number(number, key):
 # Decrypt secret string back to the original number
 def decrypt_to_number(encrypted_number, key):
     try:
-        cipher_suite = Fernet(key)
-        decrypted_number = cipher_suite.decrypt(encrypted_number)
-        return int(decrypted_number.decode())
+        with measure("decrypt_id"):
+            return get_codec(key).decode(encrypted_number)
+    except InvalidToken:
+        raise
     except Exception as e:
         print(f"Error decrypting number: {e}")
         raise SDSAPIInternalError(f"Decryption failed: {e}")
 
 
-def update_search_id(response_json, sds_id, access_key_match, search_key="id", allow_none=False):
+def encrypted_id_map(sds_id):
+    """
+    Maps decrypted ids to the tokens the caller sent, for `update_search_id`.
+    """
+    if not sds_id:
+        return None
+    return {item.get("id"): item.get("encrypt") for item in sds_id}
+
+
+def update_search_id(response_json, encrypted_ids, access_key_match, search_key="id", allow_none=False):
     search_id = response_json.get(search_key)  # Initialize search_id from the current value in response_json
 
-    if sds_id:
-        for item in sds_id:
-            if item.get("id") == search_id:
-                if access_key_match:
-                    search_id = item.get("encrypt")  # Assign encrypted value if access_key_match is True
-                response_json["encryption_search_id"] = item.get("encrypt")
+    if encrypted_ids:
+        encrypted = encrypted_ids.get(search_id)
+        if encrypted is not None:
+            if access_key_match:
+                search_id = encrypted  # Assign encrypted value if access_key_match is True
+            response_json["encryption_search_id"] = encrypted
 
     if access_key_match:
         # If access_key_match is True, update search_id in response_json
-        response_json["search_id"] = encrypt_number(search_id, settings.SECRET_KEY) if not sds_id else search_id
+        response_json["search_id"] = encrypt_number(search_id, settings.SECRET_KEY) if not encrypted_ids else search_id
         # Ensure encryption_search_id matches search_id if search_id is encrypted
         response_json["encryption_search_id"] = response_json["search_id"]
     else:
@@ -52,6 +69,75 @@ def update_search_id(response_json, sds_id, access_key_match, search_key="id", a
         response_json["encryption_search_id"] = response_json["search_id"]
 
 
+def get_access_tier(api_key: str) -> str:
+    """
+    Namespace for data cached or shared on behalf of an API key.
+
+    The internal SDS_API_KEY (public demo frontend) shares one tier; every
+    customer key gets its own, since upstream responses for it may carry
+    the wish-list-gated `hazardous` block and are authorized per key.
+    """
+    if api_key == settings.SDS_API_KEY:
+        return "demo"
+    return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def upload_file_size(upload_file: UploadFile) -> int:
+    """
+    Size of an uploaded file, taken from its spooled file without reading it.
+    """
+    if upload_file.size is not None:
+        return upload_file.size
+    position = upload_file.file.tell()
+    size = upload_file.file.seek(0, os.SEEK_END)
+    upload_file.file.seek(position)
+    return size
+
+
+def _file_md5(file: BinaryIO) -> str:
+    md5 = hashlib.md5()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+        md5.update(chunk)
+    file.seek(0)
+    return md5.hexdigest()
+
+
+async def upload_file_md5(upload_file: UploadFile) -> str:
+    """
+    MD5 of an uploaded file, hashed off the event loop from its spool.
+    """
+    return await run_in_threadpool(_file_md5, upload_file.file)
+
+
+class SizeLimitedReader:
+    """
+    Read-only view of a file that fails once more than `limit` bytes have
+    been read from it, so a file is rejected while it streams instead of
+    after being buffered. Exposes seek/tell (but no fileno) so httpx can
+    size it without rolling a SpooledTemporaryFile over to disk.
+    """
+
+    def __init__(self, file: BinaryIO, limit: int):
+        self._file = file
+        self._limit = limit
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file.read(size)
+        if self._file.tell() > self._limit:
+            raise SDSBadRequestException(
+                f"File size exceeds the limit of "
+                f"{self._limit / (1024 * 1024)} MB"
+            )
+        return chunk
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+
 def is_valid_uuid(uuid_to_test):
     try:
         uuid_obj = UUID(uuid_to_test)
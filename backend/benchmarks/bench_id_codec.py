@@ -0,0 +1,75 @@
+"""
+Per-item cost of SDS id tokens: the legacy per-call Fernet path against
+the deterministic IDCodec, cold (cipher only) and memoized.
+
+    python -m benchmarks.bench_id_codec
+"""
+import random
+
+from cryptography.fernet import Fernet
+
+from benchmarks.common import measure
+from app.core.config import settings
+from app.id_codec import IDCodec
+from app.utils import encrypted_id_map, update_search_id
+
+PAGE_SIZE = 100
+
+
+def main():
+    key = settings.SECRET_KEY
+    ids = random.sample(range(1, 13_000_000), PAGE_SIZE)
+    codec = IDCodec(key)
+    tokens = codec.encode_many(ids)
+    legacy_tokens = [Fernet(key).encrypt(str(i).encode()) for i in ids]
+
+    print(f"{PAGE_SIZE} ids per op")
+    measure(
+        "legacy Fernet(key).encrypt per id",
+        lambda: [Fernet(key).encrypt(str(i).encode()) for i in ids],
+        items=PAGE_SIZE,
+    )
+    measure(
+        "legacy Fernet(key).decrypt per id",
+        lambda: [int(Fernet(key).decrypt(t).decode()) for t in legacy_tokens],
+        items=PAGE_SIZE,
+    )
+    measure(
+        "IDCodec encode, uncached",
+        lambda: [codec._encode(i) for i in ids],
+        items=PAGE_SIZE,
+    )
+    measure(
+        "IDCodec decode, uncached",
+        lambda: [codec._decode(t) for t in tokens],
+        items=PAGE_SIZE,
+    )
+    measure(
+        "IDCodec.encode_many, memoized",
+        lambda: codec.encode_many(ids),
+        items=PAGE_SIZE,
+    )
+    measure(
+        "IDCodec.decode_many, memoized",
+        lambda: codec.decode_many(tokens),
+        items=PAGE_SIZE,
+    )
+    measure(
+        "IDCodec legacy token decode, memoized",
+        lambda: codec.decode_many(legacy_tokens),
+        items=PAGE_SIZE,
+    )
+
+    sds_id = [{"id": i, "encrypt": t} for i, t in zip(ids, tokens)]
+    rows = [{"id": i} for i in ids]
+
+    def match_ids():
+        encrypted_ids = encrypted_id_map(sds_id)
+        for row in rows:
+            update_search_id(dict(row), encrypted_ids, True, allow_none=True)
+
+    measure("update_search_id over a 100-id response", match_ids, PAGE_SIZE)
+
+
+if __name__ == "__main__":
+    main()
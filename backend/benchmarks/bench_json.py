@@ -0,0 +1,91 @@
+"""
+JSON decoding of upstream bodies and rendering of responses, with the
+stdlib json module (httpx's `Response.json()`, starlette's JSONResponse)
+against orjson (`decode_json`, the app's default ORJSONResponse):
+
+    python -m benchmarks.bench_json
+
+Sizes are those of bench_schemas: 100-id bulk details with 8 KB of
+extracted_data each, and single details with 8 KB and 512 KB.
+"""
+import asyncio
+import random
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+from httpx import Response
+from starlette.responses import JSONResponse
+
+from benchmarks.common import measure
+from benchmarks.bench_schemas import (
+    BULK_IDS,
+    EXTRACTED_DATA_SIZES,
+    details_row,
+    extracted_data,
+    response_field,
+)
+from app import schemas
+from app.clients.sds_api_client import decode_json
+
+
+def compare(name: str, items: int, **variants):
+    timings = {
+        label: measure(f"{name}: {label}", fn, items=items)
+        for label, fn in variants.items()
+    }
+    before, after = timings.values()
+    print(f"{'':<48} {before / after:>12.1f}x faster")
+
+
+def bench_payload(name: str, path: str, upstream_body, model, items: int):
+    print(f"\n{name}")
+    body = orjson.dumps(upstream_body)
+    response = Response(200, content=body)
+    print(f"{'upstream body':<48} {len(body) / 1024:>12.0f} KB")
+    compare(
+        "decode",
+        items,
+        stdlib=response.json,
+        orjson=lambda: decode_json(response),
+    )
+
+    loop = asyncio.new_event_loop()
+    content = loop.run_until_complete(
+        serialize_response(field=response_field(path), response_content=model)
+    )
+    loop.close()
+    compare(
+        "render",
+        items,
+        stdlib=lambda: JSONResponse(content),
+        orjson=lambda: ORJSONResponse(content),
+    )
+
+
+def main():
+    ids = random.sample(range(1, 13_000_000), BULK_IDS)
+
+    data = extracted_data(EXTRACTED_DATA_SIZES["8 KB"])
+    rows = [details_row(i, data) for i in ids]
+    bench_payload(
+        f"Bulk details of {BULK_IDS} ids, 8 KB of extracted_data each",
+        "/sds/multipleDetails/",
+        rows,
+        [schemas.SDSDetailsSchema(**row) for row in rows],
+        items=BULK_IDS,
+    )
+
+    for label, size in EXTRACTED_DATA_SIZES.items():
+        row = details_row(ids[0], extracted_data(size))
+        bench_payload(
+            f"Details with {label} of extracted_data",
+            "/sds/details/",
+            row,
+            schemas.SDSDetailsWithHazardousSchema(**row),
+            items=1,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+"""
+End-to-end load test of the gateway against the local stub upstream
+(`benchmarks.stub_upstream`).
+
+Starts the stub and the gateway the way the Dockerfile runs it (uvicorn,
+20 workers), then drives each endpoint in turn with a fixed number of
+concurrent clients and reports its throughput, p50/p90/p99 latency,
+errors and the resident memory of all gateway processes:
+
+    python -m benchmarks.bench_load --duration 30 --concurrency 64
+
+Results are written as JSON (to benchmarks/results/ by default). A run
+can be checked against an earlier one, failing (exit status 1) when an
+endpoint lost more than --tolerance of its throughput, or grew its p99
+latency or peak RSS by more than that:
+
+    python -m benchmarks.bench_load --baseline benchmarks/results/a.json
+    python -m benchmarks.bench_load --compare a.json b.json
+
+The response caches are disabled unless --cache is given, so every
+request goes through to the stub. The driver is a single asyncio
+process: compare runs made with the same options on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import benchmarks.common  # noqa: F401
+import httpx
+
+from app.core.config import settings
+from app.utils import encrypt_number
+
+RESULTS_FORMAT = 1
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+ENDPOINTS = [
+    "search",
+    "details",
+    "multipleDetails",
+    "upload",
+    "safetyInformationSummary",
+]
+# API key of the load; its quota tier is unlimited.
+API_KEY = "bench-load-key"
+SDS_IDS = 100_000
+RSS_SAMPLE_INTERVAL = 0.5
+
+
+class Scenario:
+    """
+    Builds the requests of one gateway endpoint.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.tokens = [
+            encrypt_number(i, settings.SECRET_KEY) for i in range(1, 2001)
+        ]
+
+    def _token(self) -> str:
+        return random.choice(self.tokens)
+
+    def request(self, endpoint: str) -> dict:
+        if endpoint == "search":
+            return {
+                "url": "/sds/search/",
+                "params": {"page": 1, "page_size": 20},
+                "json": {"search": f"product {random.randrange(SDS_IDS)}"},
+            }
+        if endpoint == "details":
+            return {"url": "/sds/details/", "json": {"sds_id": self._token()}}
+        if endpoint == "multipleDetails":
+            return {
+                "url": "/sds/multipleDetails/",
+                "json": {
+                    "sds_id": random.sample(self.tokens, self.args.bulk_ids)
+                },
+            }
+        if endpoint == "upload":
+            # A new PDF each time, so that the gateway's dedup misses.
+            pdf = b"%PDF-1.4\n" + os.urandom(self.args.upload_kb * 1024)
+            return {
+                "url": "/sds/upload/",
+                "files": [("file", ("bench.pdf", pdf, "application/pdf"))],
+            }
+        if endpoint == "safetyInformationSummary":
+            return {
+                "url": "/sds/safetyInformationSummary/",
+                "json": {"sds_id": self._token()},
+            }
+        raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def process_tree_rss(pid: int) -> int | None:
+    """
+    Resident memory in bytes of a process and all its descendants, from
+    /proc (Linux); None elsewhere.
+    """
+    children: dict[int, list[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may hold spaces: fields follow its ")".
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+def percentile(sorted_values: list[float], q: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def wait_ready(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                response = await client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up in {timeout}s")
+            await asyncio.sleep(0.25)
+
+
+def start_stub(args) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.stub_upstream",
+            "--port",
+            str(args.stub_port),
+            "--workers",
+            str(args.stub_workers),
+            "--latency-ms",
+            str(args.latency_ms),
+            "--jitter-ms",
+            str(args.jitter_ms),
+            "--payload-kb",
+            str(args.payload_kb),
+            "--pdf-kb",
+            str(args.pdf_kb),
+            "--error-rate",
+            str(args.error_rate),
+        ],
+        cwd=BACKEND_DIR,
+    )
+
+
+def start_gateway(args, metrics_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SDS_API_URL": f"http://127.0.0.1:{args.stub_port}/api/public",
+        "QUOTA_KEY_TIERS": json.dumps({API_KEY: "unlimited"}),
+        "PDF_CACHE_DIR": "",
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+    }
+    if not args.cache:
+        env.update(DETAILS_CACHE_TTL="0", SEARCH_CACHE_TTL="0")
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(args.port),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    endpoint: str,
+    concurrency: int,
+    duration: float,
+) -> tuple[list[float], dict[str, int], float]:
+    """
+    Sends requests to one endpoint from `concurrency` clients for
+    `duration` seconds; returns the latencies of the successful ones,
+    the counts of the failed ones by status and the elapsed time.
+    """
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            request = scenario.request(endpoint)
+            sent = time.perf_counter()
+            try:
+                async with client.stream("POST", **request) as response:
+                    async for _ in response.aiter_raw():
+                        pass
+                outcome = response.status_code
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            if outcome == 200:
+                latencies.append(time.perf_counter() - sent)
+            else:
+                errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def sample_rss(pid: int | None, samples: list[int]) -> None:
+    while pid is not None:
+        rss = process_tree_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+
+async def run_endpoint(client, scenario, endpoint, args, gateway_pid):
+    await drive(client, scenario, endpoint, args.concurrency, args.warmup)
+    rss_samples: list[int] = []
+    sampler = asyncio.create_task(sample_rss(gateway_pid, rss_samples))
+    try:
+        latencies, errors, elapsed = await drive(
+            client, scenario, endpoint, args.concurrency, args.duration
+        )
+    finally:
+        sampler.cancel()
+    latencies.sort()
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    def mb(value):
+        return None if value is None else round(value / 2**20, 1)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p90_ms": ms(percentile(latencies, 0.90)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "rss_peak_mb": mb(max(rss_samples) if rss_samples else None),
+        "rss_end_mb": mb(rss_samples[-1] if rss_samples else None),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    processes = []
+    gateway_url = args.gateway_url
+    gateway_pid = None
+    try:
+        if gateway_url is None:
+            processes.append(start_stub(args))
+            await wait_ready(f"http://127.0.0.1:{args.stub_port}/")
+            metrics_dir = tempfile.mkdtemp(prefix="bench-load-metrics-")
+            gateway = start_gateway(args, metrics_dir)
+            processes.append(gateway)
+            gateway_pid = gateway.pid
+            gateway_url = f"http://127.0.0.1:{args.port}"
+            await wait_ready(f"{gateway_url}/metrics")
+
+        results = {
+            "format": RESULTS_FORMAT,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "options": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "baseline", "compare")
+            },
+            "rss_idle_mb": None,
+            "endpoints": {},
+        }
+        if gateway_pid is not None:
+            rss = process_tree_rss(gateway_pid)
+            if rss is not None:
+                results["rss_idle_mb"] = round(rss / 2**20, 1)
+
+        scenario = Scenario(args)
+        async with httpx.AsyncClient(
+            base_url=gateway_url,
+            headers={"X-SDS-SEARCH-ACCESS-API-KEY": API_KEY},
+            limits=httpx.Limits(max_connections=args.concurrency),
+            timeout=60,
+        ) as client:
+            for endpoint in args.endpoints:
+                result = await run_endpoint(
+                    client, scenario, endpoint, args, gateway_pid
+                )
+                results["endpoints"][endpoint] = result
+                print_result(endpoint, result)
+        return results
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def print_result(endpoint: str, result: dict) -> None:
+    errors = sum(result["errors"].values())
+    print(
+        f"{endpoint:<26} {result['throughput_rps']:>8.1f} req/s"
+        f"  p50 {result['p50_ms']} ms  p90 {result['p90_ms']} ms"
+        f"  p99 {result['p99_ms']} ms  errors {errors}"
+        f"  rss peak {result['rss_peak_mb']} MB"
+    )
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """
+    Prints the change of each endpoint's figures against the baseline;
+    returns whether any of them regressed beyond `tolerance`.
+    """
+    if baseline.get("format") != current.get("format"):
+        print("The results were written by different benchmark versions")
+    regressed = False
+    # Figure, whether higher is better.
+    figures = [
+        ("throughput_rps", True),
+        ("p50_ms", False),
+        ("p99_ms", False),
+        ("rss_peak_mb", False),
+    ]
+    for endpoint, result in current["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            continue
+        changes = []
+        for figure, higher_is_better in figures:
+            old, new = before.get(figure), result.get(figure)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            worse = -change if higher_is_better else change
+            flag = ""
+            # p50 is informative only: it moves with the stub's latency.
+            if worse > tolerance and figure != "p50_ms":
+                flag = " REGRESSION"
+                regressed = True
+            changes.append(f"{figure} {old} -> {new} ({change:+.1%}){flag}")
+        print(f"{endpoint}:\n    " + "\n    ".join(changes))
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test of the gateway against a stub upstream."
+    )
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=20,
+        help="gateway uvicorn workers (the Dockerfile runs 20)",
+    )
+    parser.add_argument("--port", type=int, default=8003)
+    parser.add_argument(
+        "--gateway-url",
+        help="load an already running gateway instead of starting one "
+        "(and the stub); RSS is not measured then",
+    )
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--bulk-ids", type=int, default=100)
+    parser.add_argument("--upload-kb", type=int, default=100)
+    parser.add_argument("--stub-port", type=int, default=9000)
+    parser.add_argument("--stub-workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--payload-kb", type=float, default=8)
+    parser.add_argument("--pdf-kb", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        type=Path,
+        metavar=("BASELINE", "CURRENT"),
+        help="compare two results files without running",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        baseline, current = (json.loads(p.read_text()) for p in args.compare)
+        sys.exit(1 if compare(baseline, current, args.tolerance) else 0)
+
+    results = asyncio.run(run(args))
+    output = args.output or RESULTS_DIR / (
+        f"load-{time.strftime('%Y%m%dT%H%M%S')}-{results['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Results written to {output}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        sys.exit(1 if compare(baseline, results, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Request throughput of a rate-limited route under each limiter storage:
+slowapi's synchronous Redis storage (a blocking round trip per check),
+the batched storage (in-process counters, synced to Redis in the
+background) and slowapi's in-memory storage as the no-I/O ceiling.
+
+The Redis variants need REDIS_HOST, REDIS_PORT and REDIS_DB:
+
+    REDIS_HOST=localhost REDIS_PORT=6379 REDIS_DB=0 \
+        python -m benchmarks.bench_rate_limiter
+"""
+import asyncio
+import time
+
+import benchmarks.common  # noqa: F401
+import httpx
+from fastapi import FastAPI, Request
+from slowapi.errors import RateLimitExceeded
+
+from app.core.config import settings
+from app.core.redis import close_redis
+from app.throttling import CustomLimiter, get_real_ip
+
+REQUESTS = 5000
+CONCURRENCY = 50
+CLIENTS = 100
+
+
+def build_app(storage_uri: str) -> tuple[FastAPI, CustomLimiter]:
+    limiter = CustomLimiter(key_func=get_real_ip, storage_uri=storage_uri)
+    app = FastAPI()
+    app.state.limiter = limiter
+
+    @app.exception_handler(RateLimitExceeded)
+    async def rate_limited(request: Request, exc: RateLimitExceeded):
+        raise AssertionError("the benchmark limit must not be reached")
+
+    @app.get("/limited/")
+    @limiter.limit("1000000/minute")
+    async def limited(request: Request):
+        return {}
+
+    return app, limiter
+
+
+async def drive(app: FastAPI) -> float:
+    """
+    Sends REQUESTS requests from CLIENTS client IPs, CONCURRENCY at a time,
+    and returns the requests per second.
+    """
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for i in range(REQUESTS):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await client.get(
+                    "/limited/", headers={"x-real-ip": f"10.0.0.{i % CLIENTS}"}
+                )
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        return REQUESTS / (time.perf_counter() - start)
+
+
+async def run(name: str, storage_uri: str) -> None:
+    app, limiter = build_app(storage_uri)
+    await drive(app)  # warm-up
+    rate = await drive(app)
+    print(f"{name:<40} {rate:>10.0f} req/s")
+    close = getattr(limiter._storage, "close", None)
+    if close is not None and asyncio.iscoroutinefunction(close):
+        await close()
+
+
+async def main():
+    print(
+        f"{REQUESTS} requests, {CONCURRENCY} concurrent, {CLIENTS} client IPs"
+    )
+    await run("slowapi memory:// (no I/O)", "memory://")
+    if settings.redis_url:
+        await run("slowapi redis:// (sync round trip)", settings.redis_url)
+        await run("batched:// (synced to Redis)", "batched://")
+    else:
+        print("Redis is not configured: skipping the Redis variants")
+        await run("batched:// (local only)", "batched://")
+    await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
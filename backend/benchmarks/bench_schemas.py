@@ -0,0 +1,258 @@
+"""
+Per-operation cost of the CPU-bound steps of a request: body validation
+(with the id decryption of the `sds_id` validators), building the
+response schemas (`BaseSDSSchema.validate_id` encrypts every row's id),
+FastAPI's response_model validation and the JSON rendering of the
+response, at realistic sizes: a 100-row search page, 100-id bulk
+details and details with a large extracted_data. Each response is also
+rendered as TRUSTED_UPSTREAM_FAST_MODE does (`ModelResponse`, without
+the response_model pass), details also as DETAILS_PASSTHROUGH does
+(`passthrough_details` of the upstream documents), and the run fails
+unless every rendering gives the same document.
+
+    python -m benchmarks.bench_schemas
+
+Id tokens are memoized by the codec, so these are steady-state costs;
+see bench_id_codec for the uncached ones.
+"""
+import asyncio
+import hashlib
+import random
+import uuid
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+
+from benchmarks.common import measure
+from app import schemas
+from app.api.sds import router
+from app.core.config import settings
+from app.responses import ModelResponse
+from app.utils import encrypt_number
+
+PAGE_SIZE = 100
+BULK_IDS = 100
+# extracted_data sizes of a typical and of a very large SDS.
+EXTRACTED_DATA_SIZES = {"8 KB": 8 * 1024, "512 KB": 512 * 1024}
+
+
+def extracted_data(size: int) -> dict:
+    text = "Keep container tightly closed in a dry, well-ventilated place. "
+    sections = {}
+    section = 0
+    while len(sections) * 5 * (len(text) + 40) < size:
+        section += 1
+        sections[f"section_{section}"] = {
+            f"subsection_{i}": {"title": f"{section}.{i}", "text": text}
+            for i in range(1, 6)
+        }
+    return sections
+
+
+def list_row(sds_id: int) -> dict:
+    """
+    A search result row as the client hands it to SDSService: the id is
+    still the upstream's integer.
+    """
+    return {
+        "id": sds_id,
+        "search_id": encrypt_number(sds_id, settings.SECRET_KEY),
+        "uuid": str(uuid.UUID(int=sds_id)),
+        "pdf_md5": hashlib.md5(str(sds_id).encode()).hexdigest(),
+        "sds_pdf_product_name": f"Product {sds_id}",
+        "sds_pdf_manufacture_name": "Chemicals Ltd",
+        "sds_pdf_revision_date": "2024-01-31",
+        "language": "en",
+        "regulation_area": "EU",
+        "product_code": f"P-{sds_id}",
+        "permanent_link": f"https://example.com/sds/{sds_id}",
+        "is_current_version": True,
+    }
+
+
+def details_row(sds_id: int, data: dict) -> dict:
+    return {
+        **list_row(sds_id),
+        # Values of other types than declared, which the schemas coerce:
+        # a rendering that skips validation gives another document.
+        "sku": sds_id,
+        "is_current_version": 1,
+        "replaced_by_id": sds_id + 1,
+        "extracted_data": data,
+        "other_data": {},
+        "sds_pdf_manufacture_full_info": {"name": "Chemicals Ltd"},
+    }
+
+
+def hazardous() -> dict:
+    return {
+        "is_hazardous": True,
+        "regulation_check": {
+            "has_regulated_ingredients": True,
+            "regulated_ingredients": [
+                {
+                    "name": "Ethanol",
+                    "cas_no": "64-17-5",
+                    "concentration": "10-20%",
+                    "regulation": "REACH",
+                }
+            ],
+        },
+        "components": [
+            {
+                "name": "Ethanol",
+                "cas_no": "64-17-5",
+                "ec_no": "200-578-6",
+                "concentration": "10-20%",
+                "ghs_symbols": ["GHS02"],
+            }
+        ],
+    }
+
+
+def response_field(path: str):
+    for route in router.routes:
+        if route.path == path:
+            return route.response_field
+    raise LookupError(path)
+
+
+def check_conformance(name: str, mode: str, validated: bytes, rendered: bytes):
+    """
+    Fails unless a fast mode's rendering of a response is the same
+    document as the one validated against the route's response_model.
+    """
+    expected, actual = orjson.loads(validated), orjson.loads(rendered)
+    if actual != expected:
+        raise AssertionError(
+            f"{name}: {mode} response differs from response_model"
+        )
+    print(f"{f'{name}: {mode} conformance':<48} {'ok':>12}")
+
+
+def measure_response(
+    name: str, path: str, content, items: int = 1, passthrough=None
+):
+    """
+    Times FastAPI's response_model validation and encoding of `content`
+    (what the route does with the endpoint's return value), then the
+    JSON rendering of the result, against the trusted mode's rendering
+    of `content` as it is and, given `passthrough` (building the
+    DETAILS_PASSTHROUGH documents), the passthrough mode's.
+    """
+    field = response_field(path)
+    loop = asyncio.new_event_loop()
+
+    def serialize():
+        return loop.run_until_complete(
+            serialize_response(field=field, response_content=content)
+        )
+
+    measure(f"{name}: response_model", serialize, items=items)
+    encoded = serialize()
+    loop.close()
+    measure(
+        f"{name}: ORJSONResponse render",
+        lambda: ORJSONResponse(encoded),
+        items=items,
+    )
+    measure(
+        f"{name}: ModelResponse (trusted mode)",
+        lambda: ModelResponse(content),
+        items=items,
+    )
+    check_conformance(
+        name,
+        "trusted mode",
+        ORJSONResponse(encoded).body,
+        ModelResponse(content).body,
+    )
+    if passthrough is None:
+        return
+    measure(
+        f"{name}: passthrough_details + render",
+        lambda: ModelResponse(passthrough()),
+        items=items,
+    )
+    check_conformance(
+        name,
+        "passthrough",
+        ORJSONResponse(encoded).body,
+        ModelResponse(passthrough()).body,
+    )
+
+
+def main():
+    ids = random.sample(range(1, 13_000_000), max(PAGE_SIZE, BULK_IDS))
+    tokens = [encrypt_number(i, settings.SECRET_KEY) for i in ids]
+
+    print("Request bodies")
+    measure(
+        "SDSDetailsBodySchema, one sds_id",
+        lambda: schemas.SDSDetailsBodySchema(sds_id=tokens[0]),
+    )
+    measure(
+        f"MultipleSDSDetailsBodySchema, {BULK_IDS} sds_id",
+        lambda: schemas.MultipleSDSDetailsBodySchema(sds_id=tokens[:BULK_IDS]),
+        items=BULK_IDS,
+    )
+
+    print(f"\nSearch page of {PAGE_SIZE} rows")
+    rows = [list_row(i) for i in ids[:PAGE_SIZE]]
+    measure(
+        "ListSDSSchema(**row) per row",
+        lambda: [schemas.ListSDSSchema(**row) for row in rows],
+        items=PAGE_SIZE,
+    )
+    page = [schemas.ListSDSSchema(**row) for row in rows]
+    measure_response("search page", "/sds/search/", page, items=PAGE_SIZE)
+
+    for label, size in EXTRACTED_DATA_SIZES.items():
+        print(f"\nDetails with {label} of extracted_data")
+        row = details_row(ids[0], extracted_data(size))
+        row["hazardous"] = hazardous()
+        measure(
+            "SDSDetailsWithHazardousSchema(**row)",
+            lambda row=row: schemas.SDSDetailsWithHazardousSchema(**row),
+        )
+        model = schemas.SDSDetailsWithHazardousSchema(**row)
+        measure_response(
+            "details",
+            "/sds/details/",
+            model,
+            passthrough=lambda row=row: schemas.passthrough_details(
+                row, schemas.SDSDetailsWithHazardousSchema
+            ),
+        )
+
+    print(f"\nBulk details of {BULK_IDS} ids, 8 KB of extracted_data each")
+    data = extracted_data(EXTRACTED_DATA_SIZES["8 KB"])
+    bulk_rows = [details_row(i, data) for i in ids[:BULK_IDS]]
+    measure(
+        "SDSDetailsSchema(**row) per row",
+        lambda: [schemas.SDSDetailsSchema(**row) for row in bulk_rows],
+        items=BULK_IDS,
+    )
+    bulk = [schemas.SDSDetailsSchema(**row) for row in bulk_rows]
+    # A chunk that failed upstream.
+    bulk[-1] = schemas.BulkItemErrorSchema(
+        sds_id=tokens[BULK_IDS - 1],
+        pdf_md5=None,
+        error_code=503,
+        error_message="SDS API is temporarily unavailable",
+    )
+    measure_response(
+        "bulk details",
+        "/sds/multipleDetails/",
+        bulk,
+        items=BULK_IDS,
+        passthrough=lambda: [
+            schemas.passthrough_details(row) for row in bulk_rows[:-1]
+        ]
+        + bulk[-1:],
+    )
+
+
+if __name__ == "__main__":
+    main()
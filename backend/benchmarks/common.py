@@ -0,0 +1,32 @@
+"""
+Helpers shared by the benchmarks. Importing this module fills in the
+settings the app requires at import time, so benchmarks run without an
+app/.env file.
+"""
+import os
+import timeit
+
+from cryptography.fernet import Fernet
+
+os.environ.setdefault("CORS_ORIGINS", '["*"]')
+os.environ.setdefault("CORS_ALLOW_CREDENTIALS", "false")
+os.environ.setdefault("CORS_ALLOW_METHODS", '["*"]')
+os.environ.setdefault("CORS_ALLOW_HEADERS", '["*"]')
+os.environ.setdefault("SDS_API_URL", "http://127.0.0.1:9000/api/public")
+os.environ.setdefault("SECRET_KEY", Fernet.generate_key().decode())
+
+
+def measure(name: str, fn, items: int = 1, number: int | None = None):
+    """
+    Times `fn` (best of 5 repeats) and prints the cost per call and, when
+    one call handles `items` items, per item.
+    """
+    timer = timeit.Timer(fn)
+    if number is None:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=5, number=number)) / number
+    line = f"{name:<48} {best * 1e6:>12.2f} us/op"
+    if items > 1:
+        line += f" {best * 1e6 / items:>10.3f} us/item"
+    print(line)
+    return best
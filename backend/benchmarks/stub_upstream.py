@@ -0,0 +1,263 @@
+"""
+Local stand-in for the upstream SDS API, for load tests of the gateway.
+
+Answers /sds/search/, /sds/details/, /sds/multipleDetails/, /sds/upload/
+and /sds/safetyInformationSummary/ under any prefix (point SDS_API_URL
+at http://127.0.0.1:9000/api/public) with generated documents, after a
+configurable latency, and fails a share of the calls on demand:
+
+    python -m benchmarks.stub_upstream --port 9000 --latency-ms 50 \
+        --jitter-ms 20 --payload-kb 8 --pdf-kb 200 --error-rate 0.01
+
+Documents are serialized once at startup and only their ids are filled
+in per request, so the stub stays cheap next to the gateway under test.
+It is a bare ASGI app run by uvicorn.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import uuid
+
+# Read from the environment so every uvicorn worker sees the CLI options.
+LATENCY = float(os.environ.get("STUB_LATENCY_MS", "50")) / 1000
+JITTER = float(os.environ.get("STUB_JITTER_MS", "0")) / 1000
+PAYLOAD_BYTES = int(float(os.environ.get("STUB_PAYLOAD_KB", "8")) * 1024)
+PDF_BYTES = int(float(os.environ.get("STUB_PDF_KB", "200")) * 1024)
+ERROR_RATE = float(os.environ.get("STUB_ERROR_RATE", "0"))
+ERROR_STATUS = int(os.environ.get("STUB_ERROR_STATUS", "503"))
+
+PDF_CHUNK_SIZE = 64 * 1024
+JSON_HEADERS = [(b"content-type", b"application/json")]
+
+
+def _extracted_data(size: int) -> bytes:
+    """
+    An extracted_data object of about `size` bytes of JSON, shaped like
+    the upstream's: sections of subsections of text.
+    """
+    text = "Keep container tightly closed in a dry, well-ventilated place. "
+    sections = {}
+    section = 0
+    while len(json.dumps(sections)) < size:
+        section += 1
+        sections[f"section_{section}"] = {
+            f"subsection_{i}": {"title": f"{section}.{i}", "text": text}
+            for i in range(1, 6)
+        }
+    return json.dumps(sections, separators=(",", ":")).encode()
+
+
+EXTRACTED_DATA = _extracted_data(PAYLOAD_BYTES)
+PDF = (b"%PDF-1.4\n" + os.urandom(PDF_BYTES))[:PDF_BYTES]
+
+
+def _list_document(sds_id: int) -> dict:
+    return {
+        "id": sds_id,
+        "uuid": str(uuid.UUID(int=sds_id)),
+        "pdf_md5": hashlib.md5(str(sds_id).encode()).hexdigest(),
+        "sds_pdf_product_name": f"Product {sds_id}",
+        "sds_pdf_manufacture_name": "Stub Chemicals Ltd",
+        "sds_pdf_revision_date": "2024-01-31",
+        "language": "en",
+        "regulation_area": "EU",
+        "product_code": f"P-{sds_id}",
+        "sku": None,
+        "permanent_link": f"https://example.com/sds/{sds_id}",
+        "sds_web_page": None,
+        "replaced_by_id": None,
+        "newest_version_of_sds_id": None,
+        "is_current_version": True,
+        "label_generator": None,
+        "safety_information_summary": None,
+    }
+
+
+def list_document(sds_id: int) -> bytes:
+    return json.dumps(_list_document(sds_id)).encode()
+
+
+def details_document(sds_id: int) -> bytes:
+    document = _list_document(sds_id)
+    document["english_sdspdf_id"] = None
+    document["other_data"] = {}
+    document["sds_pdf_manufacture_full_info"] = {"name": "Stub Chemicals"}
+    head = json.dumps(document).encode()
+    return head[:-1] + b', "extracted_data": ' + EXTRACTED_DATA + b"}"
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def respond(send, status: int, body: bytes, headers=JSON_HEADERS):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                *headers,
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def _requested_ids(body: bytes) -> list[int]:
+    sds_id = json.loads(body or b"{}").get("sds_id")
+    if isinstance(sds_id, list):
+        return [int(i) for i in sds_id]
+    return [int(sds_id)] if sds_id else []
+
+
+async def search(body: bytes, query: dict, send):
+    page_size = int(query.get("page_size", 20))
+    first = random.randrange(1, 1_000_000)
+    documents = b",".join(
+        list_document(sds_id) for sds_id in range(first, first + page_size)
+    )
+    await respond(send, 200, b"[" + documents + b"]")
+
+
+async def details(body: bytes, query: dict, send):
+    ids = _requested_ids(body) or [random.randrange(1, 1_000_000)]
+    await respond(send, 200, details_document(ids[0]))
+
+
+async def multiple_details(body: bytes, query: dict, send):
+    # Lookups by PDF MD5 (the gateway's upload dedup) find nothing, so
+    # uploads always go through.
+    documents = b",".join(details_document(i) for i in _requested_ids(body))
+    await respond(send, 200, b"[" + documents + b"]")
+
+
+async def upload(body: bytes, query: dict, send):
+    await respond(send, 200, details_document(random.randrange(1, 1_000_000)))
+
+
+async def safety_information_summary(body: bytes, query: dict, send):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/pdf"),
+                (b"content-length", str(len(PDF)).encode()),
+            ],
+        }
+    )
+    for start in range(0, len(PDF), PDF_CHUNK_SIZE):
+        await send(
+            {
+                "type": "http.response.body",
+                "body": PDF[start : start + PDF_CHUNK_SIZE],
+                "more_body": start + PDF_CHUNK_SIZE < len(PDF),
+            }
+        )
+
+
+ROUTES = {
+    "/sds/search/": search,
+    "/sds/details/": details,
+    "/sds/multipleDetails/": multiple_details,
+    "/sds/upload/": upload,
+    "/sds/safetyInformationSummary/": safety_information_summary,
+}
+
+
+def _route(path: str):
+    for suffix, handler in ROUTES.items():
+        if path.endswith(suffix):
+            return handler
+    return None
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            await send({"type": message["type"] + ".complete"})
+            if message["type"] == "lifespan.shutdown":
+                return
+    if scope["type"] != "http":
+        return
+
+    body = await read_body(receive)
+    handler = _route(scope["path"])
+    if handler is None:
+        # Health checks and the gateway's connection warm-up.
+        await respond(send, 200, b"{}")
+        return
+    await asyncio.sleep(LATENCY + random.uniform(0, JITTER))
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        await respond(
+            send, ERROR_STATUS, b'{"error_message": "Injected failure"}'
+        )
+        return
+    query = dict(
+        part.split("=", 1)
+        for part in scope["query_string"].decode().split("&")
+        if "=" in part
+    )
+    await handler(body, query, send)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument(
+        "--jitter-ms",
+        type=float,
+        default=0,
+        help="random extra latency, uniform between 0 and this",
+    )
+    parser.add_argument(
+        "--payload-kb",
+        type=float,
+        default=8,
+        help="size of the extracted_data of each details document",
+    )
+    parser.add_argument("--pdf-kb", type=float, default=200)
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="share of calls answered with --error-status",
+    )
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    os.environ.update(
+        STUB_LATENCY_MS=str(args.latency_ms),
+        STUB_JITTER_MS=str(args.jitter_ms),
+        STUB_PAYLOAD_KB=str(args.payload_kb),
+        STUB_PDF_KB=str(args.pdf_kb),
+        STUB_ERROR_RATE=str(args.error_rate),
+        STUB_ERROR_STATUS=str(args.error_status),
+    )
+    uvicorn.run(
+        "benchmarks.stub_upstream:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="warning",
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ import {
   FormControlLabel,
   Checkbox,
 } from '@mui/material';
-import axiosInstance from 'api';
+import axiosInstance, { BACKEND_URL } from 'api';
 import { SDSUploadProgress } from 'components/custom-progress/CustomProgress';
 import { SDSUploadProgressDialog, TERMINAL_STEPS } from 'components/custom-progress/CustomProgressDialog';
 
@@ -50,6 +50,53 @@ interface SdsDetails {
 
 const MAX_FILE_SIZE_MB = 5;
 
+// Reads /sds/extractionStatusStream/ (Server-Sent Events) with fetch, since
+// EventSource cannot send the API key header. Resolves once the server
+// closes the stream; rejects if the stream is not available.
+export const streamExtractionStatus = async (
+  requestID: string,
+  email: string | null,
+  onStatus: (data: any) => void,
+  signal: AbortSignal,
+) => {
+  const urlParams = new URLSearchParams();
+  if (email) urlParams.append('email', email);
+  urlParams.append('request_id', requestID);
+  const apiKey = localStorage.getItem('apiKey');
+  const response = await fetch(
+    `${BACKEND_URL}/sds/extractionStatusStream/?${urlParams}`,
+    {
+      headers: {
+        accept: 'text/event-stream',
+        ...(apiKey ? { 'X-SDS-SEARCH-ACCESS-API-KEY': apiKey } : {}),
+      },
+      signal,
+    },
+  );
+  if (!response.ok || !response.body) {
+    throw new Error(`Extraction status stream failed: ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) return;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop() ?? '';
+    events.forEach((event) => {
+      const lines = event.split('\n');
+      if (!lines.includes('event: status')) return;
+      const data = lines
+        .filter((line) => line.startsWith('data: '))
+        .map((line) => line.slice(6))
+        .join('\n');
+      onStatus(JSON.parse(data));
+    });
+  }
+};
+
 export const getExtractionStatusV2 = (requestID: string, email: string | null) => {
   const urlParams = new URLSearchParams();
   if (email) urlParams.append('email', email);
@@ -163,40 +210,64 @@ const SDSUploadEndpointDetails: React.FC = () => {
   useEffect(() => {
     if (!requestId) return;
 
-    const getExtractStatusInterval = setInterval(() => {
-      const getExtractionStatusRequest = getExtractionStatusV2(
-        requestId,
-        formValues.email || null,
-      );
-      getExtractionStatusRequest.then(
-        (response) => {
-          if (response.status === 200) {
-            const data = response.data;
-            const fileInfoKeys = data.file_info
-              ? Object.keys(data.file_info)
-              : [];
-            const firstFileInfo =
-              fileInfoKeys.length > 0
-                ? data.file_info[fileInfoKeys[0]]
-                : null;
-            const currentProgress =
-              firstFileInfo?.progress ?? data.progress ?? 0;
-            const currentStep = firstFileInfo?.step ?? data.step ?? '';
-            setProgress(currentProgress);
-            setStep(currentStep);
-            if (currentProgress >= 100 || TERMINAL_STEPS.has(currentStep)) {
-              clearInterval(getExtractStatusInterval);
-              setLoading(false);
-              if (firstFileInfo) {
-                setSdsDetails(firstFileInfo);
-              }
+    let finished = false;
+    let getExtractStatusInterval: ReturnType<typeof setInterval> | undefined;
+    const controller = new AbortController();
+
+    const handleStatus = (data: any) => {
+      const fileInfoKeys = data.file_info ? Object.keys(data.file_info) : [];
+      const firstFileInfo =
+        fileInfoKeys.length > 0 ? data.file_info[fileInfoKeys[0]] : null;
+      const currentProgress = firstFileInfo?.progress ?? data.progress ?? 0;
+      const currentStep = firstFileInfo?.step ?? data.step ?? '';
+      setProgress(currentProgress);
+      setStep(currentStep);
+      if (
+        currentProgress >= 100 ||
+        TERMINAL_STEPS.has(currentStep) ||
+        data.error_code
+      ) {
+        finished = true;
+        clearInterval(getExtractStatusInterval);
+        setLoading(false);
+        if (firstFileInfo) {
+          setSdsDetails(firstFileInfo);
+        }
+      }
+    };
+
+    // Fall back to polling when the stream is unavailable or ends early.
+    const startPolling = () => {
+      getExtractStatusInterval = setInterval(() => {
+        getExtractionStatusV2(requestId, formValues.email || null).then(
+          (response) => {
+            if (response.status === 200) {
+              handleStatus(response.data);
             }
-          }
+          },
+        );
+      }, 3000);
+    };
+
+    streamExtractionStatus(
+      requestId,
+      formValues.email || null,
+      handleStatus,
+      controller.signal,
+    )
+      .catch((error) => {
+        if (!controller.signal.aborted) {
+          console.error('Extraction status stream failed:', error);
+        }
+      })
+      .finally(() => {
+        if (!finished && !controller.signal.aborted) {
+          startPolling();
         }
-      );
-    }, 3000);
+      });
 
     return () => {
+      controller.abort();
       clearInterval(getExtractStatusInterval);
     };
   }, [requestId]);